@@ -0,0 +1,22 @@
+import pytest
+
+from naturelifecert.hashing import get_hasher
+
+
+@pytest.mark.benchmark(group="auth")
+def test_login(benchmark, small_app):
+    client = small_app.test_client()
+
+    def login():
+        return client.post("/auth/login", data={"username": "bench", "password": "bench"})
+
+    response = benchmark(login)
+    assert response.headers["Location"] == "/"
+
+
+@pytest.mark.benchmark(group="auth")
+def test_verify_password(benchmark, small_app):
+    with small_app.app_context():
+        hasher = get_hasher()
+        pwhash = hasher.hash("bench", block=True)
+        assert benchmark(hasher.verify, pwhash, "bench", block=True)
@@ -0,0 +1,36 @@
+import email
+
+import pytest
+
+from email_corpus import generate
+from naturelifecert.scripts.outlook_check import extract_text_from_email_payload, parse_email
+
+CORPUS_SIZE = 500
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return generate(CORPUS_SIZE)
+
+
+@pytest.mark.benchmark(group="email")
+def test_extract_text_from_email_payload(benchmark, corpus):
+    messages = [email.message_from_bytes(raw) for raw, _ in corpus]
+    benchmark.extra_info["emails"] = len(messages)
+    texts = benchmark(lambda: [extract_text_from_email_payload(msg) for msg in messages])
+    assert all(texts)
+
+
+@pytest.mark.benchmark(group="email")
+def test_parse_email(benchmark, corpus):
+    raws = [raw for raw, _ in corpus]
+    benchmark.extra_info["emails"] = len(raws)
+    benchmark(lambda: [parse_email(raw) for raw in raws])
+
+
+@pytest.mark.benchmark(group="email")
+def test_extract_info(benchmark, corpus):
+    parsed = [parse_email(raw) for raw, _ in corpus]
+    benchmark.extra_info["emails"] = len(parsed)
+    results = benchmark(lambda: [message.extract_info() for message in parsed])
+    assert results == [expected for _, expected in corpus]
@@ -0,0 +1,67 @@
+"""
+Measure how fast and how accurately donation emails are parsed.
+
+Run from the repository root with the package installed::
+
+    python benchmarks/bench_extraction.py --count 5000
+"""
+import time
+
+import click
+
+from email_corpus import generate
+from naturelifecert.scripts.outlook_check import parse_email
+
+FIELDS = ("first_name", "last_name", "amount", "currency", "country", "email")
+
+
+@click.command()
+@click.option('--count', default=2000, help='Emails in the generated corpus.')
+@click.option('--seed', default=0, help='Seed of the generated corpus.')
+@click.option('--show-errors', default=5, help='Mismatches to print.')
+def main(count: int, seed: int, show_errors: int) -> None:
+    """
+    Parse a generated corpus and report the parse rate and accuracy.
+
+    Args:
+        count (int): Emails in the generated corpus.
+        seed (int): Seed of the generated corpus.
+        show_errors (int): Mismatches to print.
+    """
+    corpus = generate(count, seed)
+
+    start = time.perf_counter()
+    parsed = [parse_email(raw) for raw, _ in corpus]
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [email.extract_info() for email in parsed]
+    extract_seconds = time.perf_counter() - start
+
+    correct = 0
+    field_correct = dict.fromkeys(FIELDS, 0)
+    donations = 0
+    errors = []
+    for (_, expected), result in zip(corpus, results):
+        if result == expected:
+            correct += 1
+        elif len(errors) < show_errors:
+            errors.append((expected, result))
+        if expected is not None:
+            donations += 1
+            for key in FIELDS:
+                field_correct[key] += result is not None and result[key] == expected[key]
+
+    total = parse_seconds + extract_seconds
+    print(f'{count} emails: {count / total:,.0f} emails/s end to end')
+    print(f'   parse: {parse_seconds / count * 1e6:.1f}us per email')
+    print(f' extract: {extract_seconds / count * 1e6:.1f}us per email ({count / extract_seconds:,.0f}/s)')
+    print(f'accuracy: {correct / count:.1%} of emails fully correct')
+    for key in FIELDS:
+        print(f'{key:>10}: {field_correct[key] / max(donations, 1):.1%}')
+    for expected, result in errors:
+        print(f'expected {expected}\n     got {result}')
+
+
+if __name__ == '__main__':
+    main()
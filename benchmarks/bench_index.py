@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import POST_COUNTS
+from naturelifecert.db import get_db
+
+
+@pytest.mark.benchmark(group="index")
+@pytest.mark.parametrize("posts", POST_COUNTS)
+def test_index_first_page(benchmark, seeded_app, posts):
+    client = seeded_app(posts).test_client()
+    response = benchmark(client.get, "/")
+    assert b"Older" in response.data
+
+
+@pytest.mark.benchmark(group="index")
+@pytest.mark.parametrize("posts", POST_COUNTS)
+def test_index_deep_page(benchmark, seeded_app, posts):
+    # keyset pagination should cost the same halfway down the table
+    app = seeded_app(posts)
+    middle = posts // 2
+    with app.app_context():
+        created = get_db().execute("SELECT created FROM post WHERE id = ?", (middle,)).fetchone()[0]
+
+    client = app.test_client()
+    response = benchmark(client.get, f"/?before={created}&before_id={middle}")
+    assert b"Older" in response.data
+
+
+@pytest.mark.benchmark(group="index")
+@pytest.mark.parametrize("posts", POST_COUNTS)
+def test_index_filtered(benchmark, seeded_app, posts):
+    client = seeded_app(posts).test_client()
+    response = benchmark(client.get, "/?country=NL&currency=USD")
+    assert response.status_code == 200
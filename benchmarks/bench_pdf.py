@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+from naturelifecert.certificate import TEMPLATES, get_template
+from naturelifecert.pdf import generate_pdf_from_data
+
+ARGS = ("Ada", "Lovelace", "United Kingdom", "20.00", "GBP")
+
+
+@pytest.mark.benchmark(group="pdf")
+def test_generate_pdf_from_data(benchmark):
+    pdf = benchmark(generate_pdf_from_data, *ARGS)
+    assert pdf.startswith(b"%PDF")
+
+
+@pytest.mark.benchmark(group="pdf")
+@pytest.mark.parametrize("template", sorted(TEMPLATES))
+def test_render_template(benchmark, template):
+    compiled = get_template(template)
+    values = dict(zip(("first_name", "last_name", "country", "donation", "currency"), ARGS))
+    benchmark.extra_info["bytes"] = len(compiled.render(values))
+    benchmark(compiled.render, values)
+
+
+@pytest.mark.benchmark(group="pdf")
+def test_generate_pdf_endpoint(benchmark, small_app):
+    client = small_app.test_client()
+    query = "first_name=Ada&last_name=Lovelace&country=UK&donation=20&currency=GBP"
+    response = benchmark(client.get, f"/generate_pdf?{query}")
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="pdf-batch")
+@pytest.mark.parametrize("mode", ["separate", "document"])
+def test_render_batch(benchmark, mode):
+    compiled = get_template("default")
+    fields = ("first_name", "last_name", "country", "donation", "currency")
+    rows = [dict(zip(fields, ARGS), donation=str(i)) for i in range(200)]
+
+    def separate():
+        return sum(len(compiled.render(values)) for values in rows)
+
+    def document():
+        output = io.BytesIO()
+        compiled.render_document(iter(rows), output)
+        return len(output.getvalue())
+
+    benchmark.extra_info["bytes"] = benchmark(separate if mode == "separate" else document)
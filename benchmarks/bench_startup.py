@@ -0,0 +1,115 @@
+"""
+Measure the cold start of a worker: importing the app, ``create_app`` and
+its first requests, each in a fresh interpreter.
+
+Run from the repository root with the package installed::
+
+    python benchmarks/bench_startup.py --runs 20
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import click
+
+# Runs in a fresh interpreter; prints its timings as JSON
+WORKER = """
+import json, sys, time
+start = time.perf_counter()
+from naturelifecert import create_app
+imported = time.perf_counter()
+app = create_app(json.loads(sys.argv[1]))
+created = time.perf_counter()
+client = app.test_client()
+client.get('/')
+client.get('/auth/login')
+first = time.perf_counter()
+with app.app_context():
+    if sys.argv[2] == 'render':
+        from naturelifecert.pdf import generate_pdf_from_data
+        generate_pdf_from_data('Ada', 'Lovelace', 'UK', 20, 'GBP')
+rendered = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first requests': first - created,
+    'first render': rendered - first,
+    'reportlab loaded': 'reportlab' in sys.modules,
+}))
+"""
+
+SETUPS = (
+    ("plain", {}),
+    ("bytecode cache", {"TEMPLATE_BYTECODE_CACHE": "{cache}"}),
+    ("bytecode cache + warm up", {"TEMPLATE_BYTECODE_CACHE": "{cache}", "WARM_UP": True}),
+)
+
+
+def run_worker(config: dict, render: bool) -> dict:
+    """
+    Start one worker and collect its timings.
+
+    Args:
+        config (dict): The test config passed to ``create_app``.
+        render (bool): Also render one certificate after the first requests.
+
+    Returns:
+        dict: Seconds per startup phase, and whether reportlab was imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER, json.dumps(config), "render" if render else "-"],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+@click.command()
+@click.option('--runs', default=10, help='Workers started per setup.')
+@click.option('--render/--no-render', default=False, help='Render a certificate in each worker.')
+def main(runs: int, render: bool) -> None:
+    """
+    Start workers with and without the template cache and warm up.
+
+    Args:
+        runs (int): Workers started per setup.
+        render (bool): Render a certificate in each worker.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, "bench.sqlite")
+        cache = os.path.join(directory, "templates")
+        subprocess.run(
+            [sys.executable, "-c",
+             "from naturelifecert import create_app; from naturelifecert.db import init_db\n"
+             f"app = create_app({{'DATABASE': {database!r}, 'TESTING': True}})\n"
+             "with app.app_context(): init_db()"],
+            check=True,
+        )
+
+        for name, setup in SETUPS:
+            config = {"TESTING": True, "DATABASE": database}
+            config.update(
+                (key, value.format(cache=cache) if isinstance(value, str) else value)
+                for key, value in setup.items()
+            )
+            if "TEMPLATE_BYTECODE_CACHE" in config:
+                # the cache is filled once, e.g. at deploy time
+                run_worker(config, render=False)
+
+            results = [run_worker(config, render) for _ in range(runs)]
+            phases = [key for key in results[0] if key != "reportlab loaded"]
+            timings = ", ".join(
+                f"{phase} {statistics.median(result[phase] for result in results) * 1000:.1f}ms"
+                for phase in phases
+            )
+            total = statistics.median(sum(result[phase] for phase in phases) for result in results)
+            click.echo(
+                f"{name:26} {timings}, total {total * 1000:.1f}ms"
+                f" (reportlab {'loaded' if results[0]['reportlab loaded'] else 'not loaded'})"
+            )
+
+
+if __name__ == '__main__':
+    main()
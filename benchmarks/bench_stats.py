@@ -0,0 +1,14 @@
+import pytest
+
+from conftest import POST_COUNTS
+
+
+@pytest.mark.benchmark(group="stats")
+@pytest.mark.parametrize("posts", POST_COUNTS)
+def test_stats_json(benchmark, seeded_app, posts):
+    # reads the rollup only, so the time should not grow with the posts
+    client = seeded_app(posts).test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    response = benchmark(client.get, "/stats/json")
+    assert response.json["by_currency"]
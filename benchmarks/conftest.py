@@ -0,0 +1,72 @@
+import os
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from naturelifecert import create_app
+from naturelifecert.db import get_db, init_db
+
+# Synthetic donations, spread over a few countries and currencies
+SEED_POSTS = """
+WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?)
+INSERT INTO post (author_id, created, first_name, last_name, country, donation, currency)
+SELECT
+  1,
+  datetime('2020-01-01', '+' || i || ' minutes'),
+  'first' || i,
+  'last' || i,
+  CASE i % 4 WHEN 0 THEN 'DE' WHEN 1 THEN 'NL' WHEN 2 THEN 'UK' ELSE 'US' END,
+  i % 500 + 0.5,
+  CASE i % 3 WHEN 0 THEN 'EUR' WHEN 1 THEN 'USD' ELSE 'GBP' END
+FROM seq
+"""
+
+POST_COUNTS = [10_000, 100_000, 1_000_000]
+
+
+def make_app(database, store):
+    return create_app({
+        'DATABASE': database,
+        'CERTIFICATE_STORE': store,
+    })
+
+
+@pytest.fixture(scope='session')
+def seeded_app(tmp_path_factory):
+    """Return an app whose database holds ``posts`` synthetic donations.
+
+    Databases are built once per size and session, as the 1M one takes a
+    few seconds to fill.
+    """
+    apps = {}
+
+    def build(posts):
+        if posts not in apps:
+            directory = tmp_path_factory.mktemp(f'posts-{posts}')
+            app = make_app(str(directory / 'bench.sqlite'), str(directory / 'certificates'))
+            with app.app_context():
+                init_db()
+                db = get_db()
+                db.execute(
+                    'INSERT INTO user (username, password) VALUES (?, ?)',
+                    ('bench', generate_password_hash('bench')),
+                )
+                db.execute(SEED_POSTS, (posts,))
+                db.commit()
+                db.execute('ANALYZE')
+            apps[posts] = app
+        return apps[posts]
+
+    yield build
+
+    for app in apps.values():
+        app.extensions['db_pool'].close()
+
+
+@pytest.fixture
+def small_app(seeded_app):
+    return seeded_app(POST_COUNTS[0])
+
+
+def pytest_report_header(config):
+    return f'naturelifecert benchmarks, {os.cpu_count()} CPUs'
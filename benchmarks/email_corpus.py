@@ -0,0 +1,141 @@
+"""
+Generate a reproducible corpus of donation emails with known contents.
+
+Every sample is ``(raw, expected)`` where ``raw`` is the RFC822 message as
+fetched over IMAP and ``expected`` is what ``EmailParser.extract_info``
+should return for it (None for the emails that are not donations).
+"""
+import hashlib
+import random
+from decimal import Decimal
+from email.message import EmailMessage
+
+FIRST_NAMES = ["Ada", "Grace", "Alan", "Zoë", "Jürgen", "Marie", "Seán", "Chidi", "Mei", "Anne-Marie"]
+LAST_NAMES = ["Lovelace", "Hopper", "Turing", "Müller", "O'Brien", "Curie", "Okafor", "Chen", "van Dijk"]
+COUNTRIES = ["United Kingdom", "Germany", "Ireland", "France", "Nigeria", "Switzerland", "DE", "US"]
+SYMBOLS = {"EUR": "€", "USD": "$", "GBP": "£"}
+
+
+def _amount(rng: random.Random) -> Decimal:
+    return Decimal(rng.choice([5, 10, 20, 25, 50, 100, 250, 1000, 1234])) + Decimal(rng.choice([0, 50, 99])) / 100
+
+
+def _format_amount(amount: Decimal, style: str) -> str:
+    text = f"{amount:,.2f}"
+    if style == "de":
+        return text.replace(",", " ").replace(".", ",").replace(" ", ".")
+    if style == "ch":
+        return text.replace(",", "'")
+    return text
+
+
+def _message(sender: str, subject: str, text: str, html: bool = False) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = "donations@naturelife.org"
+    msg["Subject"] = subject
+    # hash() is salted per process; the corpus must not change between runs
+    digest = hashlib.sha1("\n".join((sender, subject, text)).encode("utf8")).hexdigest()
+    msg["Message-ID"] = f"<{digest}@example.com>"
+    if html:
+        lines = "".join(f"<p>{line}</p>" for line in text.split("\n"))
+        msg.set_content(f"<html><body><style>p {{margin: 0}}</style>{lines}</body></html>", subtype="html")
+    else:
+        msg.set_content(text)
+    return bytes(msg)
+
+
+def _paypal(rng, donor):
+    currency = rng.choice(["EUR", "USD", "GBP"])
+    text = (
+        "Hello NatureLife,\n"
+        f"{donor['name']} sent you {SYMBOLS[currency]}{_format_amount(donor['amount'], 'en')} {currency}\n"
+        f"Contributor email: {donor['email']}\n"
+        f"Country: {donor['country']}\n"
+        "Thanks for using PayPal."
+    )
+    sender = rng.choice(["service@paypal.com", "service@intl.paypal.com", "service@paypal.de"])
+    return sender, text, currency, rng.random() < 0.3
+
+
+def _stripe(rng, donor):
+    currency = rng.choice(["EUR", "USD"])
+    style = "de" if currency == "EUR" else "en"
+    text = (
+        "Receipt from NatureLife\n"
+        f"Amount paid: {SYMBOLS[currency]}{_format_amount(donor['amount'], style)}\n"
+        f"Customer name: {donor['name']}\n"
+        f"Customer email: {donor['email']}\n"
+        f"Billing country: {donor['country']}"
+    )
+    return "Stripe <receipts@stripe.com>", text, currency, True
+
+
+def _justgiving(rng, donor):
+    text = (
+        f"You have received a donation of £{_format_amount(donor['amount'], 'en')} "
+        f"from {donor['name']} ({donor['email']})\n"
+        f"Country: {donor['country']}"
+    )
+    return "JustGiving <no-reply@justgiving.com>", text, "GBP", False
+
+
+def _personal(rng, donor):
+    currency = rng.choice(["EUR", "CHF"])
+    style = "ch" if currency == "CHF" else "de"
+    text = (
+        "Hi,\n"
+        f"First name: {donor['first_name']}\n"
+        f"Last name: {donor['last_name']}\n"
+        f"Donation: {_format_amount(donor['amount'], style)} {currency}\n"
+        f"Country: {donor['country']}\n"
+        f"Email: {donor['email']}\n"
+        "Keep up the good work!"
+    )
+    return donor["email"], text, currency, False
+
+
+PROVIDERS = [_paypal, _stripe, _justgiving, _personal]
+
+
+def generate(count: int = 1000, seed: int = 0, noise: float = 0.1) -> list:
+    """
+    Build ``count`` sample emails.
+
+    Args:
+        count (int): How many emails to generate.
+        seed (int): Seed for the random choices, so runs are comparable.
+        noise (float): The share of emails that are not donations.
+
+    Returns:
+        list: ``(raw, expected)`` tuples.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        if rng.random() < noise:
+            raw = _message("newsletter@example.com", "Donation from the archive: our year in review",
+                           "Read about everything we planted this year.\nUnsubscribe at any time.")
+            corpus.append((raw, None))
+            continue
+
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        donor = {
+            "first_name": first_name,
+            "last_name": last_name,
+            "name": f"{first_name} {last_name}",
+            "amount": _amount(rng),
+            "country": rng.choice(COUNTRIES),
+            "email": f"donor{i}@example.org",
+        }
+        sender, text, currency, html = rng.choice(PROVIDERS)(rng, donor)
+        raw = _message(sender, f"Donation from {donor['name']}", text, html=html)
+        corpus.append((raw, {
+            "first_name": first_name,
+            "last_name": last_name,
+            "amount": donor["amount"],
+            "currency": currency,
+            "country": donor["country"],
+            "email": donor["email"],
+        }))
+    return corpus
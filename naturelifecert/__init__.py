@@ -9,6 +9,51 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'naturelifecert.sqlite'),
+        DATABASE_POOL_SIZE=5,
+        DATABASE_CACHED_STATEMENTS=128,
+        # WAL lets index reads run alongside inserts; NORMAL sync is safe in WAL
+        DATABASE_PRAGMAS={
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -16000,
+            'mmap_size': 256 * 1024 * 1024,
+        },
+        PASSWORD_HASH_METHOD='scrypt',
+        PASSWORD_SALT_LENGTH=16,
+        PASSWORD_HASH_WORKERS=2,
+        PASSWORD_HASH_QUEUE=8,
+        USER_CACHE_TTL=60,
+        USER_CACHE_SIZE=1024,
+        POSTS_PER_PAGE=50,
+        # Seconds proxies may serve the logged out index without asking
+        INDEX_MAX_AGE=10,
+        CERTIFICATE_MAX_AGE=24 * 60 * 60,
+        PDF_CACHE_MAX_BYTES=32 * 1024 * 1024,
+        CERTIFICATE_TEMPLATE='default',
+        CERTIFICATE_STORE=os.path.join(app.instance_path, 'certificates'),
+        # Render processes of `flask generate-certificates`
+        BULK_WORKERS=None,
+        BULK_CHUNK_SIZE=500,
+        # Certificates per response of the /generate_certificates views
+        BULK_REQUEST_LIMIT=500,
+        # Render certificates of new donations in `flask run-worker`
+        CERTIFICATE_JOBS=False,
+        JOB_BATCH_SIZE=10,
+        JOB_POLL_INTERVAL=1.0,
+        JOB_LEASE_SECONDS=300,
+        JOB_MAX_ATTEMPTS=3,
+        EXPORT_BATCH_SIZE=1000,
+        # Rows inserted per transaction by `flask import-donations` and /import
+        IMPORT_BATCH_SIZE=1000,
+        # Latency histograms on /metrics, in Prometheus text format
+        METRICS_ENABLED=False,
+        # Save a cProfile of requests taking at least this many seconds
+        PROFILE_SLOW_REQUESTS=None,
+        PROFILE_DIR=os.path.join(app.instance_path, 'profiles'),
+        # Directory for compiled templates, shared by workers; see `flask compile-templates`
+        TEMPLATE_BYTECODE_CACHE=None,
+        # Prime templates, reportlab and the connection pool in create_app
+        WARM_UP=False,
     )
 
     if test_config is None:
@@ -29,15 +74,51 @@ def create_app(test_config=None):
     def hello():
         return 'Hello, World!'
     
+    from . import warmup
+    warmup.init_app(app)
+
+    from . import metrics
+    metrics.init_app(app)
+
     from . import db
     db.init_app(app)
 
+    from . import hashing
+    hashing.init_app(app)
+
+    from . import store
+    store.init_app(app)
+
     from . import auth
     app.register_blueprint(auth.bp)
     auth.init_app(app)
 
     from . import pdf
     app.register_blueprint(pdf.bp)
+    pdf.init_app(app)
     app.add_url_rule('/', endpoint='index')
 
+    from . import bulk
+    app.register_blueprint(bulk.bp)
+    bulk.init_app(app)
+
+    from . import jobs
+    app.register_blueprint(jobs.bp)
+    jobs.init_app(app)
+
+    from . import export
+    app.register_blueprint(export.bp)
+    export.init_app(app)
+
+    from . import imports
+    app.register_blueprint(imports.bp)
+    imports.init_app(app)
+
+    from . import stats
+    app.register_blueprint(stats.bp)
+    stats.init_app(app)
+
+    if app.config['WARM_UP']:
+        warmup.warm_up(app)
+
     return app
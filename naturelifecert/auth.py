@@ -1,11 +1,14 @@
+import csv
 import functools
+from dataclasses import dataclass
 from flask import Flask, current_app
 from flask import (
     Blueprint, flash, g, redirect, render_template, request, session, url_for
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-
+from flask.cli import with_appcontext
+from naturelifecert.cache import LRUCache
 from naturelifecert.db import get_db
+from naturelifecert.hashing import HasherBusy, get_hasher
 import click
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -16,44 +19,127 @@ def register():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
-        result = current_app.test_cli_runner().invoke(
-            args=["create-user", username, "--password", password]
-        )
-        if result.exit_code == 0:
+        result = create_user(username, password)
+        if result.error is None:
             return redirect(url_for("auth.login"))
         else:
-            flash(result.stdout)
+            flash(result.error)
 
     return render_template("auth/register.html")
 
+@dataclass
+class UserResult:
+    """Outcome of creating one user; ``error`` is None on success."""
+    username: str
+    user_id: int = None
+    error: str = None
+
+def validate_user(username, password):
+    if not username:
+        return "Username is required."
+    elif not password:
+        return "Password is required."
+    return None
+
+def create_user(username, password, block=False):
+    """Create a user, hashing the password on the shared hasher pool."""
+    error = validate_user(username, password)
+    if error is not None:
+        return UserResult(username, error=error)
+
+    db = get_db()
+    # Don't spend a KDF run on a name that is obviously taken
+    if db.execute("SELECT 1 FROM user WHERE username = ?", (username,)).fetchone():
+        return UserResult(username, error=f"User {username} is already registered.")
+
+    try:
+        cursor = db.execute(
+            "INSERT INTO user (username, password) VALUES (?, ?)",
+            (username, get_hasher().hash(password, block=block)),
+        )
+        db.commit()
+    except db.IntegrityError:
+        return UserResult(username, error=f"User {username} is already registered.")
+
+    # A reused id must not pick up a stale cached row
+    invalidate_user(cursor.lastrowid)
+    return UserResult(username, user_id=cursor.lastrowid)
+
+def _user_ids(db, usernames):
+    """Map each of ``usernames`` that exists to its user id."""
+    ids = {}
+    for i in range(0, len(usernames), 500):
+        batch = usernames[i:i + 500]
+        ids.update(db.execute(
+            f"SELECT username, id FROM user WHERE username IN ({', '.join('?' * len(batch))})",
+            batch,
+        ).fetchall())
+    return ids
+
+def import_users(rows):
+    """Create users from ``(username, password)`` pairs in one transaction.
+
+    Invalid rows and names that already exist, in the database or earlier
+    in ``rows``, are reported and skipped. Returns a ``UserResult`` per row.
+    """
+    rows = list(rows)
+    results = [
+        UserResult(username, error=validate_user(username, password))
+        for username, password in rows
+    ]
+
+    db = get_db()
+    seen = set(_user_ids(db, [result.username for result in results if result.error is None]))
+    valid = []
+    for result, (_, password) in zip(results, rows):
+        if result.error is not None:
+            continue
+        if result.username in seen:
+            result.error = f"User {result.username} is already registered."
+        else:
+            seen.add(result.username)
+            valid.append((result, password))
+
+    hashes = get_hasher().hash_many(password for _, password in valid)
+    with db:
+        db.executemany(
+            "INSERT INTO user (username, password) VALUES (?, ?)",
+            [(result.username, pwhash) for (result, _), pwhash in zip(valid, hashes)],
+        )
+
+    ids = _user_ids(db, [result.username for result, _ in valid])
+    for result, _ in valid:
+        result.user_id = ids[result.username]
+        invalidate_user(result.user_id)
+
+    return results
+
 @click.command("create-user")
 @click.argument("username")
 @click.password_option()
+@with_appcontext
 def create_user_command(username, password):
     """Create a new user."""
-    with current_app.app_context():
-        db = get_db()
-        error = None
-
-        if not username:
-            error = "Username is required."
-        elif not password:
-            error = "Password is required."
-
-        if error is None:
-            try:
-                db.execute(
-                    "INSERT INTO user (username, password) VALUES (?, ?)",
-                    (username, generate_password_hash(password)),
-                )
-                db.commit()
-            except db.IntegrityError:
-                error = f"User {username} is already registered."
-
-        if error:
-            click.echo(error)
-        else:
-            click.echo(f"Created user {username}")
+    result = create_user(username, password, block=True)
+
+    if result.error:
+        click.echo(result.error)
+        click.get_current_context().exit(1)
+    click.echo(f"Created user {username}")
+
+@click.command("import-users")
+@click.argument("file", type=click.File("r", encoding="utf8"))
+@with_appcontext
+def import_users_command(file):
+    """Create users from a CSV file with username and password columns."""
+    rows = [(row["username"], row["password"]) for row in csv.DictReader(file)]
+    results = import_users(rows)
+
+    for result in results:
+        if result.error:
+            click.echo(result.error, err=True)
+    created = sum(result.error is None for result in results)
+    click.echo(f"Created {created} of {len(results)} users")
 
 @bp.route('/login', methods=('GET', 'POST'))
 def login():
@@ -68,18 +154,38 @@ def login():
 
         if user is None:
             error = 'Incorrect username.'
-        elif not check_password_hash(user['password'], password):
+        elif not get_hasher().verify(user['password'], password):
             error = 'Incorrect password.'
 
         if error is None:
+            user = rehash_password(user, password)
             session.clear()
             session['user_id'] = user['id']
+            cache_user(user)
             return redirect(url_for('index'))
 
         flash(error)
 
     return render_template('auth/login.html')
 
+def rehash_password(user, password):
+    """Upgrade a stored hash made with outdated parameters."""
+    hasher = get_hasher()
+    if not hasher.needs_rehash(user['password']):
+        return user
+
+    try:
+        pwhash = hasher.hash(password)
+    except HasherBusy:
+        # Not worth failing a good login over; try again next time
+        return user
+
+    db = get_db()
+    db.execute('UPDATE user SET password = ? WHERE id = ?', (pwhash, user['id']))
+    db.commit()
+    invalidate_user(user['id'])
+    return dict(user, password=pwhash)
+
 @bp.before_app_request
 def load_logged_in_user():
     user_id = session.get('user_id')
@@ -87,9 +193,33 @@ def load_logged_in_user():
     if user_id is None:
         g.user = None
     else:
-        g.user = get_db().execute(
+        g.user = get_user(user_id)
+
+def get_user(user_id):
+    cache = current_app.extensions['user_cache']
+    user = cache.get(user_id) if cache is not None else None
+
+    if user is None:
+        user = get_db().execute(
             'SELECT * FROM user WHERE id = ?', (user_id,)
         ).fetchone()
+        if user is not None:
+            user = cache_user(user)
+
+    return user
+
+def cache_user(user):
+    user = dict(user)
+    cache = current_app.extensions['user_cache']
+    if cache is not None:
+        cache.set(user['id'], user)
+    return user
+
+def invalidate_user(user_id):
+    """Drop a cached user row, e.g. after its password or name changed."""
+    cache = current_app.extensions['user_cache']
+    if cache is not None:
+        cache.pop(user_id)
 
 def login_required(view):
     @functools.wraps(view)
@@ -103,10 +233,20 @@ def login_required(view):
 
 @bp.route('/logout')
 def logout():
+    user_id = session.get('user_id')
+    if user_id is not None:
+        invalidate_user(user_id)
     session.clear()
     return redirect(url_for('index'))
 
 def init_app(app):
+    # A TTL of 0 turns the cache off, every request then reads the user row
+    ttl = app.config['USER_CACHE_TTL']
+    app.extensions['user_cache'] = (
+        LRUCache(max_entries=app.config['USER_CACHE_SIZE'], ttl=ttl, sizeof=lambda user: 1)
+        if ttl else None
+    )
     app.cli.add_command(create_user_command)
+    app.cli.add_command(import_users_command)
 
 
@@ -0,0 +1,291 @@
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import time
+import zipfile
+
+import click
+from flask import Blueprint, current_app, g, request, send_file, url_for
+from flask.cli import with_appcontext
+from werkzeug.exceptions import abort
+from werkzeug.utils import secure_filename
+
+from naturelifecert.auth import login_required
+from naturelifecert.db import get_db
+from naturelifecert.pdf import generate_pdf_from_data
+
+bp = Blueprint("bulk", __name__)
+
+
+FIELDS = ("first_name", "last_name", "country", "donation", "currency")
+
+
+def iter_post_chunks(db, chunk_size, author_id=None, after_id=0, before_id=None):
+    """Stream the certificate fields of every post in ``chunk_size`` batches.
+
+    With ``author_id`` only that author's posts are included, and only ids
+    between ``after_id`` and ``before_id`` (both exclusive).
+    """
+    cursor = db.execute(
+        "SELECT id, first_name, last_name, country, donation, currency"
+        " FROM post WHERE (? IS NULL OR author_id = ?)"
+        " AND id > ? AND (? IS NULL OR id < ?) ORDER BY id",
+        (author_id, author_id, after_id, before_id, before_id),
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        # Plain tuples so the rows can be pickled to the worker processes
+        yield [tuple(row) for row in rows]
+
+
+def render_post(row, template="default"):
+    post_id, first_name, last_name, country, donation, currency = row
+    filename = "_".join(
+        [str(post_id), secure_filename(first_name), secure_filename(last_name)]
+    )
+    pdf = generate_pdf_from_data(
+        first_name, last_name, country, donation, currency, template
+    )
+    return f"{filename}.pdf", pdf
+
+
+def render_chunks(chunks, workers=None, template="default"):
+    """Yield ``(filename, pdf)`` for every row, rendering across processes.
+
+    One chunk is submitted ahead of the one being yielded so the pool stays
+    busy while results are written out, without holding the whole table in
+    memory. ``workers=1`` renders in-process. Workers are spawned rather
+    than forked, as the app's thread pools and pooled connections are not
+    safe to copy into a child.
+    """
+    render = functools.partial(render_post, template=template)
+    if workers == 1:
+        for chunk in chunks:
+            yield from map(render, chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending = None
+        for chunk in chunks:
+            results = executor.map(
+                render, chunk, chunksize=max(1, len(chunk) // (workers * 4))
+            )
+            if pending is not None:
+                yield from pending
+            pending = results
+
+        if pending is not None:
+            yield from pending
+
+
+def write_certificates(results, output, progress=None):
+    """Write rendered certificates to a ZIP archive or a directory.
+
+    ``output`` is a directory path, a path ending in ``.zip`` or a binary
+    file object, which is written as a ZIP archive. Returns the number of
+    certificates written.
+    """
+    count = 0
+    if isinstance(output, (str, os.PathLike)) and not str(output).endswith(".zip"):
+        directory = pathlib.Path(output)
+        directory.mkdir(parents=True, exist_ok=True)
+        for filename, pdf in results:
+            (directory / filename).write_bytes(pdf)
+            count += 1
+            if progress is not None:
+                progress(1)
+        return count
+
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf in results:
+            archive.writestr(filename, pdf)
+            count += 1
+            if progress is not None:
+                progress(1)
+    return count
+
+
+def write_document(chunks, output, template="default", progress=None):
+    """Write every row as a page of one PDF to the binary file ``output``.
+
+    Pages share the template's fonts, images and static layout, so this
+    renders in-process. Returns the number of pages.
+    """
+    from naturelifecert.certificate import certificate_values, get_template
+
+    def pages():
+        for chunk in chunks:
+            for row in chunk:
+                yield certificate_values(dict(zip(FIELDS, row[1:])))
+            if progress is not None:
+                progress(len(chunk))
+
+    return get_template(template).render_document(pages(), output)
+
+
+def generate_certificates(
+    db, output, workers=None, chunk_size=500, template="default", progress=None
+):
+    """Render every post's certificate into ``output``.
+
+    A path ending in ``.pdf`` gets one multi-page document, see
+    ``write_document``; otherwise see ``write_certificates``.
+    Returns ``(count, seconds)``.
+    """
+    start = time.perf_counter()
+    chunks = iter_post_chunks(db, chunk_size)
+    if isinstance(output, (str, os.PathLike)) and str(output).endswith(".pdf"):
+        with open(output, "wb") as f:
+            count = write_document(chunks, f, template, progress)
+    else:
+        results = render_chunks(chunks, workers, template)
+        count = write_certificates(results, output, progress)
+    return count, time.perf_counter() - start
+
+
+def throughput(count, seconds):
+    return count / seconds if seconds else 0.0
+
+
+def author_chunks(db, chunk_size):
+    """Chunks of the current author's next BULK_REQUEST_LIMIT posts.
+
+    Like the index, requests seek by post id: the ``after`` query argument
+    is the id the batch starts after. Returns ``(chunks, next_id)`` where
+    ``next_id`` is the first post left for the next request, or None.
+    """
+    after = request.args.get("after", 0, type=int)
+    following = db.execute(
+        "SELECT id FROM post WHERE author_id = ? AND id > ? ORDER BY id LIMIT 1 OFFSET ?",
+        (g.user["id"], after, current_app.config["BULK_REQUEST_LIMIT"]),
+    ).fetchone()
+    next_id = None if following is None else following["id"]
+    chunks = iter_post_chunks(
+        db, chunk_size, g.user["id"], after_id=after, before_id=next_id
+    )
+    return chunks, next_id
+
+
+def link_next(response, endpoint, next_id):
+    if next_id is not None:
+        next_url = url_for(endpoint, after=next_id - 1)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
+
+
+@bp.route("/generate_certificates", methods=("POST",))
+@login_required
+def generate_certificates_view():
+    """The current author's certificates as a ZIP archive.
+
+    At most BULK_REQUEST_LIMIT per response, rendered in-process so a
+    request cannot take over every CPU; ``flask generate-certificates``
+    renders everything across processes. Further archives are linked from
+    the ``Link: rel="next"`` header.
+    """
+    chunks, next_id = author_chunks(get_db(), current_app.config["BULK_CHUNK_SIZE"])
+
+    # Spill to disk past 64MB rather than holding a large archive in memory
+    archive = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+    start = time.perf_counter()
+    count = write_certificates(
+        render_chunks(chunks, workers=1, template=current_app.config["CERTIFICATE_TEMPLATE"]),
+        archive,
+    )
+    seconds = time.perf_counter() - start
+    if count == 0:
+        abort(404, "You have no donations to print.")
+    current_app.logger.info(
+        "Rendered %d certificates in %.2fs (%.1f certificates/s)",
+        count, seconds, throughput(count, seconds),
+    )
+
+    archive.seek(0)
+    response = send_file(
+        archive,
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name="naturelifecert_certificates.zip",
+    )
+    return link_next(response, "bulk.generate_certificates_view", next_id)
+
+
+@bp.route("/generate_certificates/document", methods=("POST",))
+@login_required
+def generate_document_view():
+    """The current author's certificates as pages of one PDF.
+
+    reportlab holds every page in memory until the document is saved, so a
+    document has at most BULK_REQUEST_LIMIT pages. The rest follow in the
+    documents linked from the ``Link: rel="next"`` header.
+    """
+    chunks, next_id = author_chunks(get_db(), current_app.config["BULK_CHUNK_SIZE"])
+
+    document = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+    start = time.perf_counter()
+    count = write_document(
+        chunks, document, template=current_app.config["CERTIFICATE_TEMPLATE"]
+    )
+    seconds = time.perf_counter() - start
+    if count == 0:
+        abort(404, "You have no donations to print.")
+    current_app.logger.info(
+        "Rendered %d certificate pages in %.2fs (%.1f certificates/s)",
+        count, seconds, throughput(count, seconds),
+    )
+
+    document.seek(0)
+    response = send_file(
+        document,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name="naturelifecert_certificates.pdf",
+    )
+    return link_next(response, "bulk.generate_document_view", next_id)
+
+
+@click.command("generate-certificates")
+@click.option(
+    "--output", "-o", required=True, type=click.Path(),
+    help="ZIP archive (*.zip), single multi-page PDF (*.pdf) or directory to write the certificates to.",
+)
+@click.option(
+    "--workers", "-w", type=int, default=None,
+    help="Number of render processes. Defaults to BULK_WORKERS or the CPU count.",
+)
+@click.option(
+    "--chunk-size", type=int, default=None,
+    help="Rows fetched from the database per batch. Defaults to BULK_CHUNK_SIZE.",
+)
+@with_appcontext
+def generate_certificates_command(output, workers, chunk_size):
+    """Render a certificate for every donation."""
+    db = get_db()
+    total = db.execute("SELECT COUNT(*) FROM post").fetchone()[0]
+
+    with click.progressbar(length=total, label="Rendering certificates") as bar:
+        count, seconds = generate_certificates(
+            db,
+            output,
+            workers=workers or current_app.config["BULK_WORKERS"],
+            chunk_size=chunk_size or current_app.config["BULK_CHUNK_SIZE"],
+            template=current_app.config["CERTIFICATE_TEMPLATE"],
+            progress=bar.update,
+        )
+
+    click.echo(
+        f"Rendered {count} certificates in {seconds:.2f}s"
+        f" ({throughput(count, seconds):.1f} certificates/s)"
+    )
+
+
+def init_app(app):
+    app.cli.add_command(generate_certificates_command)
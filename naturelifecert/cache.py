@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache.
+
+    Entries are evicted oldest-use first once either ``max_entries`` or the
+    summed ``sizeof(value)`` exceeds ``max_size``. A ``ttl`` in seconds makes
+    entries expire on read. Any limit left as ``None`` is not enforced.
+    """
+
+    def __init__(self, max_size=None, max_entries=None, ttl=None, sizeof=len):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._live_entry(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            # Never let a single oversized value flush the whole cache
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self.size += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+        return entry
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_size is not None and self.size > self.max_size)
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self.size -= size
@@ -0,0 +1,383 @@
+import functools
+import hashlib
+import io
+import logging
+import zlib
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4, landscape, letter
+from reportlab.lib.rl_accel import fp_str
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# Write compressed streams as binary; ASCII85 makes them a quarter larger
+# and costs more than the compression itself
+rl_config.useA85 = 0
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Text:
+    """Fixed text drawn on every certificate."""
+    x: float
+    y: float
+    text: str
+    font: str = "Helvetica"
+    size: float = 12
+    centred: bool = False
+
+
+@dataclass(frozen=True)
+class Image:
+    """Background or logo image, decoded once per compiled template."""
+    path: str
+    x: float
+    y: float
+    width: float = None
+    height: float = None
+
+
+@dataclass(frozen=True)
+class Rect:
+    x: float
+    y: float
+    width: float
+    height: float
+    line_width: float = 1
+
+
+@dataclass(frozen=True)
+class Field:
+    """A donation value stamped after its (static) label."""
+    key: str
+    x: float
+    y: float
+    label: str = ""
+    font: str = "Helvetica"
+    size: float = 12
+
+
+@dataclass(frozen=True)
+class CertificateTemplate:
+    """Layout of one certificate design.
+
+    Bump ``version`` whenever the layout changes so cached and stored
+    certificates rendered from the old layout are not reused.
+    """
+    name: str
+    version: int
+    pagesize: tuple
+    static: tuple = ()
+    fields: tuple = ()
+    # (font name, TrueType file) pairs embedded in the PDF
+    fonts: tuple = ()
+
+
+class PageSkeleton:
+    """A rendered one-page PDF whose page content can be filled in later.
+
+    reportlab rebuilds and serialises the whole document (catalog, fonts,
+    page tree, images, info) on every ``save()``. For a fixed layout all of
+    that is identical between certificates, so the skeleton keeps those
+    bytes and only rebuilds the page content stream, the cross-reference
+    table and the trailer around the ``marker`` left in the page.
+    """
+
+    def __init__(self, pdf, marker):
+        marker_at = pdf.index(marker)
+        number_end = pdf.rindex(b" 0 obj", 0, marker_at)
+        obj_start = pdf.rindex(b"\n", 0, number_end) + 1
+        stream_start = pdf.index(b"stream\n", number_end) + len(b"stream\n")
+        stream_end = pdf.index(b"endstream", marker_at)
+        obj_end = pdf.index(b"endobj\n", stream_end) + len(b"endobj\n")
+        xref_at = pdf.rindex(b"\nxref\n") + 1
+        trailer_at = pdf.index(b"trailer\n", xref_at)
+        startxref_at = pdf.index(b"startxref\n", trailer_at)
+
+        self.obj_number = int(pdf[obj_start:number_end])
+        self.obj_start = obj_start
+        self.obj_length = obj_end - obj_start
+        self.head = pdf[stream_start:marker_at]
+        self.tail = pdf[marker_at + len(marker):stream_end]
+        self.prefix = pdf[:obj_start]
+        self.middle = pdf[obj_end:xref_at]
+        self.xref_at = xref_at
+        self.trailer = pdf[trailer_at:startxref_at]
+
+        # Skip the "xref" and "0 N" lines; entry 0 is the free-list head
+        entries = pdf[xref_at:trailer_at].split(b"\n")[3:]
+        self.offsets = [int(entry[:10]) for entry in entries if entry.strip()]
+
+    def render(self, page_ops):
+        content = zlib.compress(self.head + page_ops + self.tail)
+        obj = b"%d 0 obj\n<<\n/Filter [ /FlateDecode ] /Length %d\n>>\nstream\n%s\nendstream\nendobj\n" % (
+            self.obj_number, len(content), content
+        )
+        delta = len(obj) - self.obj_length
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.offsets) + 1)]
+        xref.extend(
+            b"%010d 00000 n \n" % (offset + delta if offset > self.obj_start else offset)
+            for offset in self.offsets
+        )
+        return b"".join([
+            self.prefix,
+            obj,
+            self.middle,
+            *xref,
+            self.trailer,
+            b"startxref\n%d\n%%%%EOF\n" % (self.xref_at + delta),
+        ])
+
+
+class CompiledTemplate:
+    """A certificate template with its static layout work done up front.
+
+    Fonts are registered, images decoded and label widths measured once.
+    Single certificates are stamped into a pre-rendered ``PageSkeleton``
+    when every field uses one of the standard PDF fonts; embedded fonts are
+    subset per document, so those templates go through reportlab each time.
+    Multi-page documents draw the static content once into a form XObject
+    that every page references (see ``begin`` and ``stamp``).
+    """
+
+    marker = b"%naturelifecert-fields"
+
+    def __init__(self, template):
+        self.template = template
+        self.form_name = f"{template.name}-v{template.version}"
+
+        registered = set(pdfmetrics.getRegisteredFontNames())
+        for name, path in template.fonts:
+            if name not in registered:
+                pdfmetrics.registerFont(TTFont(name, path))
+
+        self._images = {
+            element.path: ImageReader(element.path)
+            for element in template.static
+            if isinstance(element, Image)
+        }
+        self._labels = tuple(
+            Text(field.x, field.y, field.label, field.font, field.size)
+            for field in template.fields
+            if field.label
+        )
+        self._slots = [
+            (
+                field.key,
+                field.x + pdfmetrics.stringWidth(field.label, field.font, field.size),
+                field.y,
+                field.font,
+                field.size,
+            )
+            for field in template.fields
+        ]
+
+        self._skeleton = None
+        if all(field.font in pdfmetrics.standardFonts for field in template.fields):
+            try:
+                self._compile_skeleton()
+            except (AttributeError, ValueError):
+                # The skeleton reads reportlab's output and internals; if a
+                # release lays them out differently, render through reportlab
+                logger.warning(
+                    "Cannot compile a page skeleton for template %r; rendering"
+                    " every certificate with reportlab", template.name, exc_info=True,
+                )
+                self._skeleton = None
+
+    def new_canvas(self, output, page_compression=1):
+        # invariant output keeps the bytes identical for identical input
+        return canvas.Canvas(
+            output,
+            pagesize=self.template.pagesize,
+            invariant=1,
+            pageCompression=page_compression,
+        )
+
+    def begin(self, pdf_canvas):
+        """Define the shared static content on ``pdf_canvas``."""
+        pdf_canvas.beginForm(self.form_name)
+        self._draw_static(pdf_canvas)
+        pdf_canvas.endForm()
+
+    def stamp(self, pdf_canvas, values):
+        """Draw one certificate page for ``values``, a mapping of field keys."""
+        pdf_canvas.doForm(self.form_name)
+        self._draw_fields(pdf_canvas, values)
+        pdf_canvas.showPage()
+
+    def render_document(self, rows, output):
+        """Render one page per mapping in ``rows`` into the binary file ``output``.
+
+        Fonts, images and the static layout are written once and shared by
+        every page. Returns the number of pages.
+        """
+        pdf_canvas = self.new_canvas(output)
+        self.begin(pdf_canvas)
+        pages = 0
+        for values in rows:
+            self.stamp(pdf_canvas, values)
+            pages += 1
+        # reportlab keeps the pages in memory and serialises them all here
+        pdf_canvas.save()
+        return pages
+
+    def render(self, values):
+        """Render a single certificate and return the PDF bytes."""
+        if self._skeleton is not None:
+            try:
+                return self._skeleton.render(self._field_ops(values))
+            except UnicodeEncodeError:
+                # Outside the standard fonts' encoding; let reportlab decide
+                pass
+
+        buffer = io.BytesIO()
+        pdf_canvas = self.new_canvas(buffer)
+        self._draw_static(pdf_canvas)
+        self._draw_fields(pdf_canvas, values)
+        pdf_canvas.showPage()
+        pdf_canvas.save()
+        return buffer.getvalue()
+
+    def _draw_static(self, pdf_canvas):
+        for element in self.template.static + self._labels:
+            if isinstance(element, Text):
+                pdf_canvas.setFont(element.font, element.size)
+                if element.centred:
+                    pdf_canvas.drawCentredString(element.x, element.y, element.text)
+                else:
+                    pdf_canvas.drawString(element.x, element.y, element.text)
+            elif isinstance(element, Image):
+                pdf_canvas.drawImage(
+                    self._images[element.path], element.x, element.y,
+                    width=element.width, height=element.height, mask="auto",
+                )
+            elif isinstance(element, Rect):
+                pdf_canvas.setLineWidth(element.line_width)
+                pdf_canvas.rect(element.x, element.y, element.width, element.height)
+
+    def _draw_fields(self, pdf_canvas, values):
+        text = pdf_canvas.beginText()
+        for key, x, y, font, size in self._slots:
+            text.setFont(font, size)
+            text.setTextOrigin(x, y)
+            text.textOut(str(values[key]))
+        pdf_canvas.drawText(text)
+
+    def _compile_skeleton(self):
+        buffer = io.BytesIO()
+        pdf_canvas = self.new_canvas(buffer, page_compression=0)
+        self._draw_static(pdf_canvas)
+        # Reference the field fonts so they land in the page resources, and
+        # remember the names reportlab gave them inside this document
+        self._font_refs = {}
+        text = pdf_canvas.beginText()
+        for _, _, _, font, size in self._slots:
+            text.setFont(font, size)
+            self._font_refs[font] = pdf_canvas._doc.getInternalFontName(font).encode("ascii")
+        pdf_canvas.drawText(text)
+        pdf_canvas.addLiteral(self.marker.decode("ascii"))
+        pdf_canvas.showPage()
+        pdf_canvas.save()
+        self._skeleton = PageSkeleton(buffer.getvalue(), self.marker)
+
+    def _field_ops(self, values):
+        ops = []
+        for key, x, y, font, size in self._slots:
+            # Standard fonts are WinAnsi encoded, i.e. cp1252
+            text = str(values[key]).encode("cp1252")
+            for char, escaped in ((b"\\", b"\\\\"), (b"(", b"\\("), (b")", b"\\)"),
+                                  (b"\r", b"\\r"), (b"\n", b"\\n")):
+                text = text.replace(char, escaped)
+            ops.append(b"BT %s %s Tf 1 0 0 1 %s %s Tm (%s) Tj ET\n" % (
+                self._font_refs[font],
+                fp_str(size).encode("ascii"),
+                fp_str(x).encode("ascii"),
+                fp_str(y).encode("ascii"),
+                text,
+            ))
+        return b"".join(ops)
+
+
+def _labelled_fields(x, y, step, font="Helvetica", size=12):
+    labels = [
+        ("first_name", "First Name: "),
+        ("last_name", "Last Name: "),
+        ("country", "Country: "),
+        ("donation", "Donation: "),
+        ("currency", "Currency: "),
+    ]
+    return tuple(
+        Field(key, x, y - i * step, label, font, size)
+        for i, (key, label) in enumerate(labels)
+    )
+
+
+TEMPLATES = {
+    template.name: template
+    for template in (
+        CertificateTemplate(
+            name="default",
+            version=3,
+            pagesize=letter,
+            static=(Text(100, 700, "Form Data:"),),
+            fields=_labelled_fields(100, 680, 20),
+        ),
+        CertificateTemplate(
+            name="landscape",
+            version=2,
+            pagesize=landscape(A4),
+            static=(
+                Rect(36, 36, landscape(A4)[0] - 72, landscape(A4)[1] - 72, line_width=3),
+                Text(landscape(A4)[0] / 2, 480, "Certificate of Donation",
+                     font="Times-Bold", size=36, centred=True),
+                Text(landscape(A4)[0] / 2, 440, "With thanks from NatureLife",
+                     font="Times-Italic", size=16, centred=True),
+            ),
+            fields=_labelled_fields(260, 360, 30, font="Times-Roman", size=18),
+        ),
+    )
+}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(template):
+    return CompiledTemplate(template)
+
+
+def get_template(name="default"):
+    """Return the compiled template registered under ``name``."""
+    return compile_template(TEMPLATES[name])
+
+
+FIELDS = ("first_name", "last_name", "country", "donation", "currency")
+
+
+def format_donation(donation):
+    """Two decimals however the amount arrived, e.g. 20.5 from SQLite becomes 20.50."""
+    try:
+        return f"{Decimal(str(donation)):.2f}"
+    except InvalidOperation:
+        return str(donation)
+
+
+def certificate_values(values):
+    """The fields of ``values`` as they are printed."""
+    return dict(values, donation=format_donation(values["donation"]))
+
+
+def certificate_key(values, template="default"):
+    """Content hash identifying the certificate rendered for ``values``."""
+    template = TEMPLATES[template]
+    values = certificate_values(values)
+    parts = (template.name, template.version, *(values[key] for key in FIELDS))
+    return hashlib.sha256("\x1f".join(map(str, parts)).encode("utf8")).hexdigest()
+
+
+def render_certificate(values, template="default"):
+    return get_template(template).render(certificate_values(values))
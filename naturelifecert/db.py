@@ -1,38 +1,159 @@
+import os
+import queue
 import sqlite3
 
 import click
 from flask import current_app, g
+from flask.cli import with_appcontext
+
+
+class ConnectionPool:
+    """Per-process pool of configured SQLite connections.
+
+    Up to ``size`` idle connections are kept between app contexts so each
+    request skips the connect, PRAGMA setup and cold statement/page caches.
+    Connections beyond that are opened on demand and closed on release.
+    """
+
+    def __init__(self, database, size=5, pragmas=None, cached_statements=128):
+        self.database = database
+        self.size = size
+        self.pragmas = pragmas or {}
+        self.cached_statements = cached_statements
+        self._reset()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['DATABASE'],
+            size=config['DATABASE_POOL_SIZE'],
+            pragmas=config['DATABASE_PRAGMAS'],
+            cached_statements=config['DATABASE_CACHED_STATEMENTS'],
+        )
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self.size)
+
+    def connect(self):
+        db = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=self.cached_statements,
+            # Connections move between worker threads, one at a time
+            check_same_thread=False,
+        )
+        db.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            db.execute(f'PRAGMA {name} = {value}')
+        return db
+
+    def acquire(self):
+        if os.getpid() != self._pid:
+            # Forked worker: never share the parent's sqlite handles
+            self._reset()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, db):
+        if os.getpid() != self._pid:
+            return
+
+        if db.in_transaction:
+            db.rollback()
+
+        try:
+            self._idle.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db_connection = current_app.extensions['db_pool'].acquire()
+        # e.g. metrics.InstrumentedConnection, when metrics are enabled
+        instrument = current_app.extensions.get('db_instrument')
+        g.db = instrument(g.db_connection) if instrument else g.db_connection
 
     return g.db
 
 
 def close_db(e=None):
-    db = g.pop('db', None)
+    g.pop('db', None)
+    db = g.pop('db_connection', None)
 
     if db is not None:
-        db.close()
+        current_app.extensions['db_pool'].release(db)
 
-def init_db():
-    db = get_db()
+# Columns added to tables that older databases already have. CREATE TABLE
+# IF NOT EXISTS leaves those tables alone, so upgrade_db adds them.
+ADDED_COLUMNS = {
+    'post': (
+        ('email', 'TEXT'),
+        ('certificate_hash', 'TEXT REFERENCES certificate (hash)'),
+        ('certificate_key', 'TEXT'),
+    ),
+}
 
+def create_schema(db):
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
 
+def init_db():
+    db = get_db()
+
+    tables = [
+        row[0] for row in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    for table in tables:
+        db.execute(f'DROP TABLE "{table}"')
+    create_schema(db)
+
+def upgrade_db():
+    """Bring an existing database up to schema.sql, keeping its data.
+
+    Returns the added columns as ``table.column`` names.
+    """
+    db = get_db()
+    create_schema(db)
+
+    added = []
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row['name'] for row in db.execute(f'PRAGMA table_info("{table}")')}
+        for name, definition in columns:
+            if name not in existing:
+                db.execute(f'ALTER TABLE "{table}" ADD COLUMN {name} {definition}')
+                added.append(f'{table}.{name}')
+    db.commit()
+    return added
+
 def init_app(app):
+    app.extensions['db_pool'] = ConnectionPool.from_config(app.config)
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(upgrade_db_command)
 
 @click.command('init-db')
 def init_db_command():
     """Clear the existing data and create new tables."""
     init_db()
-    click.echo('Initialized the database.')
\ No newline at end of file
+    click.echo('Initialized the database.')
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Create missing tables, columns, indexes and triggers, keeping the data."""
+    added = upgrade_db()
+    click.echo(f"Upgraded the database; added {', '.join(added) or 'no columns'}.")
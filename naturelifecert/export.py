@@ -0,0 +1,177 @@
+import csv
+import datetime
+import io
+import json
+import sys
+
+import click
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask.cli import with_appcontext
+from werkzeug.exceptions import abort
+
+from naturelifecert.auth import login_required
+from naturelifecert.db import get_db
+
+bp = Blueprint("export", __name__, url_prefix="/export")
+
+COLUMNS = ("id", "created", "first_name", "last_name", "country", "donation", "currency")
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+def _where(start=None, end=None, currency=None):
+    """Filters on ``created`` (start inclusive, end exclusive) and currency."""
+    filters = []
+    params = []
+    if start is not None:
+        filters.append("created >= ?")
+        params.append(start)
+    if end is not None:
+        filters.append("created < ?")
+        params.append(end)
+    if currency is not None:
+        filters.append("currency = ?")
+        params.append(currency)
+    return (f" WHERE {' AND '.join(filters)}" if filters else ""), params
+
+
+def iter_donations(db, start=None, end=None, currency=None, batch_size=1000):
+    """Yield the matching posts oldest first, ``batch_size`` rows at a time."""
+    where, params = _where(start, end, currency)
+    cursor = db.execute(
+        f"SELECT {', '.join(COLUMNS)} FROM post{where} ORDER BY created, id", params
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def donation_totals(db, start=None, end=None, currency=None):
+    """Number and sum of donations per currency, aggregated by SQLite."""
+    where, params = _where(start, end, currency)
+    return [
+        dict(row)
+        for row in db.execute(
+            "SELECT currency, COUNT(*) AS donations, ROUND(SUM(donation), 2) AS total"
+            f" FROM post{where} GROUP BY currency ORDER BY currency",
+            params,
+        )
+    ]
+
+
+def _value(value):
+    return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value
+
+
+def format_csv(batches):
+    """Render batches of rows as CSV text, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in batches:
+        writer.writerows([_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def format_ndjson(batches):
+    """Render batches of rows as one JSON object per line."""
+    for rows in batches:
+        yield "".join(
+            json.dumps({key: _value(row[key]) for key in COLUMNS}) + "\n" for row in rows
+        )
+
+
+FORMATTERS = {"csv": format_csv, "ndjson": format_ndjson}
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        date = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date, e.g. 2023-01-31.")
+    if date.tzinfo is not None:
+        # created is stored naive in UTC, and compared as text
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date.isoformat(sep=" ")
+
+
+def get_filters(args):
+    try:
+        return {
+            "start": _parse_date(args.get("start"), "start"),
+            "end": _parse_date(args.get("end"), "end"),
+            "currency": args.get("currency") or None,
+        }
+    except ValueError as e:
+        abort(400, str(e))
+
+
+@bp.route("")
+@login_required
+def export():
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        abort(400, f"format must be one of {', '.join(FORMATS)}.")
+    mimetype, extension = FORMATS[fmt]
+
+    batches = iter_donations(
+        get_db(), batch_size=current_app.config["EXPORT_BATCH_SIZE"], **get_filters(request.args)
+    )
+    # Rows are read and sent batch by batch while the response streams
+    return Response(
+        stream_with_context(FORMATTERS[fmt](batches)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=donations.{extension}"},
+    )
+
+
+@bp.route("/totals")
+@login_required
+def totals():
+    return jsonify(donation_totals(get_db(), **get_filters(request.args)))
+
+
+@click.command("export-donations")
+@click.option(
+    "--output", "-o", type=click.File("w", encoding="utf8"), default="-",
+    help="File to write to. Defaults to standard output.",
+)
+@click.option("--format", "-f", "fmt", type=click.Choice(list(FORMATS)), default="csv")
+@click.option("--start", help="Only donations created on or after this ISO date.")
+@click.option("--end", help="Only donations created before this ISO date.")
+@click.option("--currency", help="Only donations in this currency.")
+@click.option("--totals", "show_totals", is_flag=True, help="Print per-currency totals to stderr.")
+@with_appcontext
+def export_donations_command(output, fmt, start, end, currency, show_totals):
+    """Export donations as CSV or NDJSON."""
+    try:
+        filters = {
+            "start": _parse_date(start, "--start"),
+            "end": _parse_date(end, "--end"),
+            "currency": currency,
+        }
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    db = get_db()
+    batches = iter_donations(db, batch_size=current_app.config["EXPORT_BATCH_SIZE"], **filters)
+    for chunk in FORMATTERS[fmt](batches):
+        output.write(chunk)
+
+    if show_totals:
+        for row in donation_totals(db, **filters):
+            click.echo(f"{row['currency']}: {row['donations']} donations, {row['total']}", file=sys.stderr)
+
+
+def init_app(app):
+    app.cli.add_command(export_donations_command)
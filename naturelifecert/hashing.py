@@ -0,0 +1,98 @@
+import concurrent.futures
+import functools
+import threading
+
+from flask import current_app
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from naturelifecert.metrics import timed
+
+
+class HasherBusy(TooManyRequests):
+    description = "Too many sign-ins are being processed, please try again shortly."
+
+
+class PasswordHasher:
+    """Runs the slow password KDF on a small dedicated thread pool.
+
+    hashlib releases the GIL while hashing, so ``workers`` bounds the CPU
+    spent on KDFs no matter how many request threads are logging in. At most
+    ``max_queue`` hashes may be running or waiting; past that the caller gets
+    ``HasherBusy`` (429) straight away instead of queueing behind a burst.
+    """
+
+    def __init__(self, method="scrypt", salt_length=16, workers=2, max_queue=8, timeout=30):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        self._slots = threading.BoundedSemaphore(max_queue)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            method=config["PASSWORD_HASH_METHOD"],
+            salt_length=config["PASSWORD_SALT_LENGTH"],
+            workers=config["PASSWORD_HASH_WORKERS"],
+            max_queue=config["PASSWORD_HASH_QUEUE"],
+        )
+
+    def hash(self, password, block=False):
+        with timed("password_hash", operation="hash"):
+            return self._run(
+                generate_password_hash, password, self.method, self.salt_length, block=block
+            )
+
+    def hash_many(self, passwords):
+        """Hash ``passwords`` in parallel, waiting for free slots as needed."""
+        futures = [
+            self._submit(generate_password_hash, password, self.method, self.salt_length, block=True)
+            for password in passwords
+        ]
+        return [future.result(timeout=self.timeout) for future in futures]
+
+    def verify(self, pwhash, password, block=False):
+        with timed("password_hash", operation="verify"):
+            return self._run(check_password_hash, pwhash, password, block=block)
+
+    def needs_rehash(self, pwhash):
+        """Whether ``pwhash`` was made with other parameters than configured."""
+        return pwhash.split("$", 1)[0] != self._method_prefix
+
+    @functools.cached_property
+    def _method_prefix(self):
+        # Let werkzeug expand the defaults, e.g. "scrypt" -> "scrypt:32768:8:1"
+        return generate_password_hash("", self.method, self.salt_length).split("$", 1)[0]
+
+    def _run(self, func, *args, block=False):
+        future = self._submit(func, *args, block=block)
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            # Still queued behind other hashes; give up like a full queue
+            future.cancel()
+            raise HasherBusy(retry_after=1)
+
+    def _submit(self, func, *args, block=False):
+        if not self._slots.acquire(blocking=block):
+            raise HasherBusy(retry_after=1)
+
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+def get_hasher():
+    return current_app.extensions["password_hasher"]
+
+
+def init_app(app):
+    app.extensions["password_hasher"] = PasswordHasher.from_config(app.config)
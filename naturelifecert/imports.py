@@ -0,0 +1,276 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import re
+
+import click
+from flask import Blueprint, current_app, flash, g, jsonify, render_template, request
+from flask.cli import with_appcontext
+
+from naturelifecert.auth import login_required
+from naturelifecert.db import get_db
+
+bp = Blueprint("imports", __name__)
+
+# Active ISO 4217 currency codes
+CURRENCIES = frozenset("""
+AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND BOB BRL BSD BTN BWP BYN
+BZD CAD CDF CHF CLP CNY COP CRC CUP CVE CZK DJF DKK DOP DZD EGP ERN ETB EUR FJD FKP GBP GEL GHS
+GIP GMD GNF GTQ GYD HKD HNL HTG HUF IDR ILS INR IQD IRR ISK JMD JOD JPY KES KGS KHR KMF KPW KRW
+KWD KYD KZT LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR MVR MWK MXN MYR MZN NAD
+NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN PYG QAR RON RSD RUB RWF SAR SBD SCR SDG SEK SGD
+SHP SLE SOS SRD SSP STN SYP SZL THB TJS TMT TND TOP TRY TTD TWD TZS UAH UGX USD UYU UZS VES VND
+VUV WST XAF XCD XOF XPF YER ZAR ZMW ZWL
+""".split())
+
+EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+MAX_DONATION = decimal.Decimal("99999999.99")
+REQUIRED = ("first_name", "last_name", "country", "donation", "currency")
+FORMATS = ("csv", "ndjson")
+REJECT_COLUMNS = ("line", "error", "row")
+# Rejects listed in an upload response; the rest are only counted
+REPORTED_REJECTS = 100
+
+INSERT_POST = (
+    "INSERT INTO post (first_name, last_name, country, donation, currency, email, created, author_id)"
+    " VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)"
+)
+
+
+class UnreadableFile(ValueError):
+    """The file stopped decoding part way; the rows before it were imported."""
+
+    def __init__(self, message, imported, rejected):
+        super().__init__(message)
+        self.imported = imported
+        self.rejected = rejected
+
+
+def validate_donation(row):
+    """Check one input row and return ``(values, error)``.
+
+    ``values`` holds the columns of the post to insert, minus the author.
+    """
+    if not isinstance(row, dict):
+        return None, "Row is not a JSON object."
+
+    fields = {key: str(row.get(key) or "").strip() for key in REQUIRED + ("email", "created")}
+    for key in REQUIRED:
+        if not fields[key]:
+            return None, f"{key} is required."
+
+    try:
+        donation = decimal.Decimal(fields["donation"])
+    except decimal.InvalidOperation:
+        return None, f"Donation {fields['donation']!r} is not a number."
+    if not donation.is_finite() or not 0 < donation <= MAX_DONATION:
+        return None, f"Donation {fields['donation']!r} is out of range."
+    if donation.as_tuple().exponent < -2:
+        return None, f"Donation {fields['donation']!r} has more than two decimals."
+
+    currency = fields["currency"].upper()
+    if currency not in CURRENCIES:
+        return None, f"Currency {fields['currency']!r} is not an ISO 4217 code."
+
+    email = fields["email"] or None
+    if email is not None and not EMAIL.fullmatch(email):
+        return None, f"Email {email!r} is not valid."
+
+    created = None
+    if fields["created"]:
+        try:
+            created = datetime.datetime.fromisoformat(fields["created"])
+        except ValueError:
+            return None, f"Created {fields['created']!r} is not an ISO date."
+        if created.tzinfo is not None:
+            # Stored naive in UTC like CURRENT_TIMESTAMP; sqlite3 cannot read offsets back
+            created = created.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        created = created.isoformat(sep=" ")
+
+    return (
+        fields["first_name"], fields["last_name"], fields["country"], str(donation),
+        currency, email, created,
+    ), None
+
+
+def read_rows(file, fmt):
+    """Yield ``(line, row)`` pairs from a CSV or NDJSON text file, lazily.
+
+    NDJSON lines that do not parse are passed on as their text, which
+    ``validate_donation`` rejects.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError:
+            yield line, text.rstrip("\n")
+
+
+def import_donations(db, rows, author_id, batch_size=1000, reject=None):
+    """Insert valid rows as posts of ``author_id``, ``batch_size`` per transaction.
+
+    ``rows`` yields ``(line, row)`` pairs and is consumed lazily, so only
+    one batch is held in memory. Invalid rows are passed to
+    ``reject(line, error, row)``. Returns ``(imported, rejected)`` and
+    raises ``UnreadableFile`` when the text does not decode.
+    """
+    imported = rejected = 0
+    batch = []
+    try:
+        for line, row in rows:
+            values, error = validate_donation(row)
+            if error is not None:
+                rejected += 1
+                if reject is not None:
+                    reject(line, error, row)
+                continue
+
+            batch.append(values + (author_id,))
+            if len(batch) >= batch_size:
+                imported += _insert(db, batch)
+                batch = []
+    except UnicodeDecodeError:
+        if batch:
+            imported += _insert(db, batch)
+        raise UnreadableFile(
+            f"The file is not UTF-8 text. Imported {imported} donations"
+            f" and rejected {rejected} before the first undecodable byte.",
+            imported,
+            rejected,
+        )
+
+    if batch:
+        imported += _insert(db, batch)
+    return imported, rejected
+
+
+def _insert(db, batch):
+    with db:
+        db.executemany(INSERT_POST, batch)
+    return len(batch)
+
+
+def guess_format(filename):
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+class RejectReport:
+    """Writes rejected rows to a CSV file, created with the first reject."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._writer = None
+
+    def __call__(self, line, error, row):
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="", encoding="utf8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(REJECT_COLUMNS)
+        self._writer.writerow((line, error, row if isinstance(row, str) else json.dumps(row)))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+@bp.route("/import", methods=("GET", "POST"))
+@login_required
+def upload():
+    summary = None
+    if request.method == "POST":
+        upload = request.files.get("file")
+        fmt = request.form.get("format") or (upload and guess_format(upload.filename))
+        if upload is None or not upload.filename:
+            error = "Choose a CSV or NDJSON file to import."
+        elif fmt not in FORMATS:
+            error = f"Format must be one of {', '.join(FORMATS)}."
+        else:
+            error = None
+            rejects = []
+
+            def reject(line, message, row):
+                if len(rejects) < REPORTED_REJECTS:
+                    rejects.append({"line": line, "error": message})
+
+            # The upload is parsed straight from werkzeug's spooled file
+            file = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+            try:
+                imported, rejected = import_donations(
+                    get_db(),
+                    read_rows(file, fmt),
+                    g.user["id"],
+                    batch_size=current_app.config["IMPORT_BATCH_SIZE"],
+                    reject=reject,
+                )
+            except UnreadableFile as e:
+                error = str(e)
+                imported, rejected = e.imported, e.rejected
+            summary = {"imported": imported, "rejected": rejected, "rejects": rejects}
+
+        wants_json = request.accept_mimetypes.best == "application/json"
+        if error is not None:
+            if wants_json:
+                return jsonify(dict(summary or {}, error=error)), 400
+            flash(error)
+        elif wants_json:
+            return jsonify(summary)
+
+    return render_template("imports/upload.html", summary=summary)
+
+
+@click.command("import-donations")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--author", required=True, help="Username the donations are recorded for.")
+@click.option(
+    "--format", "-f", "fmt", type=click.Choice(FORMATS), default=None,
+    help="Input format. Guessed from the file name by default.",
+)
+@click.option(
+    "--batch-size", type=int, default=None,
+    help="Rows inserted per transaction. Defaults to IMPORT_BATCH_SIZE.",
+)
+@click.option(
+    "--rejects", type=click.Path(dir_okay=False), default=None,
+    help="CSV report of rejected rows. Defaults to FILE.rejects.csv.",
+)
+@with_appcontext
+def import_donations_command(file, author, fmt, batch_size, rejects):
+    """Import donations from a CSV or NDJSON file."""
+    db = get_db()
+    user = db.execute("SELECT id FROM user WHERE username = ?", (author,)).fetchone()
+    if user is None:
+        raise click.BadParameter(f"User {author} does not exist.", param_hint="--author")
+
+    report = RejectReport(rejects or f"{file}.rejects.csv")
+    try:
+        with open(file, encoding="utf-8-sig", newline="") as f:
+            imported, rejected = import_donations(
+                db,
+                read_rows(f, fmt or guess_format(file)),
+                user["id"],
+                batch_size=batch_size or current_app.config["IMPORT_BATCH_SIZE"],
+                reject=report,
+            )
+    except UnreadableFile as e:
+        raise click.ClickException(str(e))
+    finally:
+        report.close()
+
+    click.echo(f"Imported {imported} donations, rejected {rejected}.")
+    if rejected:
+        click.echo(f"Rejected rows written to {report.path}")
+
+
+def init_app(app):
+    app.cli.add_command(import_donations_command)
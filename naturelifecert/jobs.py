@@ -0,0 +1,211 @@
+import time
+
+import click
+from flask import Blueprint, current_app, g, jsonify, render_template, send_file, url_for
+from flask.cli import with_appcontext
+from werkzeug.exceptions import abort
+
+from naturelifecert.auth import login_required
+from naturelifecert.db import get_db
+from naturelifecert.store import attach_certificate, get_store
+
+bp = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+
+def enqueue(db, post_id, template="default"):
+    """Queue a certificate render for ``post_id``; the caller commits."""
+    return db.execute(
+        "INSERT INTO job (post_id, template) VALUES (?, ?)", (post_id, template)
+    ).lastrowid
+
+
+def claim_jobs(db, limit=1, lease=300, max_attempts=3):
+    """Mark up to ``limit`` jobs as running and return their certificate fields.
+
+    BEGIN IMMEDIATE takes the write lock before reading, so two workers can
+    never claim the same job. Jobs left running for longer than ``lease``
+    seconds belong to a worker that died and are handed out again, unless
+    they already ran ``max_attempts`` times; those are marked failed.
+    """
+    expired = (f"-{lease} seconds",)
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(
+            "UPDATE job SET status = 'failed', finished = CURRENT_TIMESTAMP,"
+            " error = 'The worker stopped while rendering, too many times.'"
+            " WHERE status = 'running' AND started < datetime('now', ?) AND attempts >= ?",
+            expired + (max_attempts,),
+        )
+        jobs = db.execute(
+            "SELECT j.id, j.post_id, j.template, j.attempts,"
+            " p.first_name, p.last_name, p.country, p.donation, p.currency"
+            " FROM job j JOIN post p ON j.post_id = p.id"
+            " WHERE j.status IN ('queued', 'running')"
+            " AND (j.status = 'queued' OR j.started < datetime('now', ?))"
+            " ORDER BY j.id LIMIT ?",
+            expired + (limit,),
+        ).fetchall()
+        db.executemany(
+            "UPDATE job SET status = 'running', attempts = attempts + 1,"
+            " started = CURRENT_TIMESTAMP WHERE id = ?",
+            [(job["id"],) for job in jobs],
+        )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return jobs
+
+
+def render_job(job):
+    """Render the certificate of ``job`` and return ``(pdf, certificate_key)``."""
+    from naturelifecert.certificate import FIELDS, certificate_key, render_certificate
+
+    values = {key: job[key] for key in FIELDS}
+    return render_certificate(values, job["template"]), certificate_key(values, job["template"])
+
+
+def complete_job(db, job_id, post_id, pdf, key):
+    digest = attach_certificate(db, post_id, pdf, key)
+    db.execute(
+        "UPDATE job SET status = 'done', certificate_hash = ?, error = NULL,"
+        " finished = CURRENT_TIMESTAMP WHERE id = ?",
+        (digest, job_id),
+    )
+    db.commit()
+
+
+def fail_job(db, job_id, error, max_attempts=3):
+    """Record ``error`` and queue the job again until it ran ``max_attempts`` times."""
+    db.execute(
+        "UPDATE job SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+        " error = ?, finished = CURRENT_TIMESTAMP WHERE id = ?",
+        (max_attempts, error, job_id),
+    )
+    db.commit()
+
+
+def run_worker(db, batch_size=10, poll_interval=1.0, lease=300, max_attempts=3, once=False):
+    """Render queued certificates until interrupted.
+
+    With ``once`` the worker stops as soon as the queue is empty. Returns the
+    number of jobs processed.
+    """
+    processed = 0
+    while True:
+        jobs = claim_jobs(db, batch_size, lease, max_attempts)
+        if not jobs:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        for job in jobs:
+            try:
+                pdf, key = render_job(job)
+            except Exception as e:
+                current_app.logger.exception("Certificate job %d failed", job["id"])
+                fail_job(db, job["id"], str(e), max_attempts)
+            else:
+                complete_job(db, job["id"], job["post_id"], pdf, key)
+            processed += 1
+
+
+def get_job(id):
+    job = (
+        get_db()
+        .execute(
+            "SELECT j.id, j.post_id, j.status, j.attempts, j.error, j.certificate_hash,"
+            " j.created, j.finished,"
+            " p.first_name, p.last_name, p.author_id"
+            " FROM job j JOIN post p ON j.post_id = p.id"
+            " WHERE j.id = ?",
+            (id,),
+        )
+        .fetchone()
+    )
+
+    if job is None:
+        abort(404, f"Job id {id} doesn't exist.")
+
+    if job["author_id"] != g.user["id"]:
+        abort(403)
+
+    return job
+
+
+def job_status(job):
+    status = {
+        "id": job["id"],
+        "post_id": job["post_id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+    }
+    if job["status"] == "done":
+        status["download_url"] = url_for("jobs.download", id=job["id"])
+    return status
+
+
+@bp.route("/<int:id>")
+@login_required
+def status_page(id):
+    return render_template("jobs/status.html", job=job_status(get_job(id)))
+
+
+@bp.route("/<int:id>/status")
+@login_required
+def status(id):
+    response = jsonify(job_status(get_job(id)))
+    if response.json["status"] in ("queued", "running"):
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+@bp.route("/<int:id>/download")
+@login_required
+def download(id):
+    job = get_job(id)
+    if job["status"] != "done":
+        abort(409, f"Job {id} is {job['status']}.")
+
+    return send_file(
+        get_store().path(job["certificate_hash"]),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=f"naturelifecert_{job['first_name']}_{job['last_name']}.pdf",
+        etag=job["certificate_hash"],
+    )
+
+
+@click.command("run-worker")
+@click.option("--once", is_flag=True, help="Exit once the queue is empty.")
+@click.option(
+    "--batch-size", type=int, default=None,
+    help="Jobs claimed per transaction. Defaults to JOB_BATCH_SIZE.",
+)
+@click.option(
+    "--poll-interval", type=float, default=None,
+    help="Seconds to wait when the queue is empty. Defaults to JOB_POLL_INTERVAL.",
+)
+@with_appcontext
+def run_worker_command(once, batch_size, poll_interval):
+    """Render queued certificates in the background."""
+    config = current_app.config
+    try:
+        processed = run_worker(
+            get_db(),
+            batch_size=batch_size or config["JOB_BATCH_SIZE"],
+            poll_interval=poll_interval or config["JOB_POLL_INTERVAL"],
+            lease=config["JOB_LEASE_SECONDS"],
+            max_attempts=config["JOB_MAX_ATTEMPTS"],
+            once=once,
+        )
+    except KeyboardInterrupt:
+        # running jobs are handed out again once their lease expires
+        return
+    click.echo(f"Processed {processed} jobs.")
+
+
+def init_app(app):
+    app.cli.add_command(run_worker_command)
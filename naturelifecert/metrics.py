@@ -0,0 +1,232 @@
+import bisect
+import contextlib
+import cProfile
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, has_app_context, request
+
+# Seconds; roughly the Prometheus client defaults
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """A Prometheus style histogram, one series per label combination."""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        # Counts per bucket; exposition makes them cumulative
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in sorted(self._series.items())
+            ]
+
+        for key, counts, total, count in series:
+            labels = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                le = ",".join(labels + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """The metrics of one process.
+
+    Every worker process keeps its own numbers, so scrape each worker (or
+    run one process per port) when the server forks several.
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "naturelifecert_request_duration_seconds",
+            "Time spent handling a request.",
+            labels=("endpoint", "method", "status"),
+        )
+        self.sql_queries = Histogram(
+            "naturelifecert_request_sql_queries",
+            "SQL statements executed per request.",
+            labels=("endpoint",),
+            buckets=QUERY_BUCKETS,
+        )
+        self.sql_seconds = Histogram(
+            "naturelifecert_request_sql_seconds",
+            "Time spent in SQLite per request.",
+            labels=("endpoint",),
+        )
+        self.timings = {
+            "pdf_render": Histogram(
+                "naturelifecert_pdf_render_seconds",
+                "Time spent rendering one certificate.",
+                labels=("template",),
+            ),
+            "password_hash": Histogram(
+                "naturelifecert_password_hash_seconds",
+                "Time spent waiting for a password hash or check.",
+                labels=("operation",),
+            ),
+        }
+
+    def expose(self):
+        histograms = [self.request_seconds, self.sql_queries, self.sql_seconds, *self.timings.values()]
+        return "\n".join(histogram.expose() for histogram in histograms) + "\n"
+
+
+class InstrumentedConnection:
+    """Wraps a sqlite3 connection to count and time statements for this request."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            g.sql_queries = g.get("sql_queries", 0) + 1
+            g.sql_seconds = g.get("sql_seconds", 0.0) + time.perf_counter() - start
+
+    def execute(self, *args):
+        return self._timed(self._db.execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(self._db.executemany, *args)
+
+    def executescript(self, *args):
+        return self._timed(self._db.executescript, *args)
+
+    def commit(self):
+        return self._timed(self._db.commit)
+
+    def __enter__(self):
+        self._db.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._timed(self._db.__exit__, *exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def get_metrics():
+    return current_app.extensions.get("metrics") if has_app_context() else None
+
+
+@contextlib.contextmanager
+def timed(name, **labels):
+    """Record how long the block takes under ``name``; a no-op without metrics."""
+    metrics = get_metrics()
+    if metrics is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name].observe(time.perf_counter() - start, **labels)
+
+
+_profiler_lock = threading.Lock()
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+
+    if current_app.config["PROFILE_SLOW_REQUESTS"] is not None and _profiler_lock.acquire(blocking=False):
+        # Only one profiler can run at a time; concurrent requests go unprofiled
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_request(response):
+    seconds = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or "unknown"
+
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.request_seconds.observe(
+            seconds, endpoint=endpoint, method=request.method, status=response.status_code
+        )
+        metrics.sql_queries.observe(g.get("sql_queries", 0), endpoint=endpoint)
+        metrics.sql_seconds.observe(g.get("sql_seconds", 0.0), endpoint=endpoint)
+
+    return response
+
+
+def _stop_profiler(e=None):
+    # A teardown callback, so the profiler is stopped even when the view raised
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+
+    profiler.disable()
+    _profiler_lock.release()
+    seconds = time.perf_counter() - g.request_start
+    if seconds >= current_app.config["PROFILE_SLOW_REQUESTS"]:
+        _save_profile(profiler, request.endpoint or "unknown", seconds)
+
+
+def _save_profile(profiler, endpoint, seconds):
+    directory = current_app.config["PROFILE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{seconds * 1000:.0f}ms.prof"
+    )
+    profiler.dump_stats(path)
+    current_app.logger.warning(
+        "%s %s took %.0fms, profile saved to %s", request.method, request.path, seconds * 1000, path
+    )
+
+
+def metrics_view():
+    return Response(get_metrics().expose(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    metrics_enabled = app.config["METRICS_ENABLED"]
+    if not metrics_enabled and app.config["PROFILE_SLOW_REQUESTS"] is None:
+        return
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_stop_profiler)
+
+    if metrics_enabled:
+        app.extensions["metrics"] = Metrics()
+        app.extensions["db_instrument"] = InstrumentedConnection
+        app.add_url_rule("/metrics", endpoint="metrics", view_func=metrics_view)
@@ -1,12 +1,18 @@
-from flask import Blueprint, flash, g, redirect, render_template, request, url_for, make_response, send_file
+from flask import (
+    Blueprint, current_app, flash, g, make_response, redirect, render_template, request, session,
+    url_for, send_file
+)
 from werkzeug.exceptions import abort
 
 from naturelifecert.auth import login_required
+from naturelifecert.cache import LRUCache
 from naturelifecert.db import get_db
+from naturelifecert.jobs import enqueue
+from naturelifecert.metrics import timed
+from naturelifecert.store import attach_certificate, get_store
 
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import pathlib
+import datetime
+import hashlib
 import io
 
 bp = Blueprint("pdf", __name__)
@@ -14,14 +20,133 @@ bp = Blueprint("pdf", __name__)
 
 @bp.route("/")
 def index():
+    country = request.args.get("country") or None
+    currency = request.args.get("currency") or None
+    before = request.args.get("before")
+    before_id = request.args.get("before_id", type=int)
+    per_page = current_app.config["POSTS_PER_PAGE"]
+
+    filters = []
+    params = []
+    if country is not None:
+        filters.append("country = ?")
+        params.append(country)
+    if currency is not None:
+        filters.append("currency = ?")
+        params.append(currency)
+    if before is not None and before_id is not None:
+        # Keyset pagination: seek past the last row of the previous page
+        # through the (created, id) indexes instead of using OFFSET.
+        filters.append("(created, p.id) < (?, ?)")
+        params.extend([before, before_id])
+
+    where = f" WHERE {' AND '.join(filters)}" if filters else ""
+
     db = get_db()
+    etag, last_modified = index_validators(db)
+    if "_flashes" not in session and index_is_fresh(etag, last_modified):
+        # Nothing changed since the client's copy: skip the query and template
+        return cache_index(not_modified(etag), last_modified)
     # Don't expose email address to the wild :)
     posts = db.execute(
-        "SELECT p.id, first_name, last_name, country, donation, currency, created"
+        "SELECT p.id, first_name, last_name, country, donation, currency, created, author_id"
         " FROM post p JOIN user u ON p.author_id = u.id"
-        " ORDER BY created DESC"
+        f"{where}"
+        " ORDER BY created DESC, p.id DESC"
+        " LIMIT ?",
+        (*params, per_page + 1),
     ).fetchall()
-    return render_template("pdf/index.html", posts=posts)
+
+    # The extra row only tells us whether there is an older page
+    next_page = None
+    if len(posts) > per_page:
+        posts = posts[:per_page]
+        last = posts[-1]
+        next_page = url_for(
+            "pdf.index",
+            country=country,
+            currency=currency,
+            before=str(last["created"]),
+            before_id=last["id"],
+        )
+
+    response = make_response(render_template(
+        "pdf/index.html",
+        posts=posts,
+        next_page=next_page,
+        country=country,
+        currency=currency,
+    ))
+    if "_flashes" in session:
+        # A flashed message is shown once and must not be replayed from a cache
+        response.cache_control.no_store = True
+        return response
+
+    response.set_etag(etag)
+    return cache_index(response, last_modified)
+
+
+def index_validators(db):
+    """Cheap ``(etag, last_modified)`` for the index page.
+
+    ``post_changes`` counts every insert, delete and edit of a post. The
+    page shown also depends on the query string and on who is logged in.
+    """
+    version, changed = db.execute("SELECT version, changed FROM post_changes").fetchone()
+    user_id = g.user["id"] if g.user else None
+    key = f"{version}|{user_id}|{request.query_string.decode('latin-1')}"
+    etag = hashlib.sha256(key.encode("utf8")).hexdigest()[:32]
+
+    last_modified = None
+    if changed is not None:
+        # CURRENT_TIMESTAMP is UTC
+        last_modified = datetime.datetime.fromisoformat(str(changed)).replace(
+            tzinfo=datetime.timezone.utc
+        )
+    return etag, last_modified
+
+
+def index_is_fresh(etag, last_modified):
+    """Whether the client's copy of the index is still current."""
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        return request.if_none_match.contains(etag)
+    # Only the logged out page advertises Last-Modified
+    since = request.if_modified_since
+    return (
+        g.user is None
+        and last_modified is not None
+        and since is not None
+        and last_modified <= since
+    )
+
+
+def cache_index(response, last_modified):
+    response.vary.add("Cookie")
+    if g.user is None:
+        # Everyone logged out sees the same page, so proxies may share it
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["INDEX_MAX_AGE"]
+        response.last_modified = last_modified
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def cache_certificate(response):
+    """Let the donor's browser reuse a certificate without shared caches keeping it."""
+    # send_file marks a response with max_age as public
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config["CERTIFICATE_MAX_AGE"]
+    return response
 
 
 # TODO: Create and update could be bundled together
@@ -47,24 +172,22 @@ def create():
             flash(error)
         else:
             db = get_db()
-            db.execute(
-                "INSERT INTO post (first_name, last_name, country, donation, currency, author_id, created)"
-                " VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
-                (first_name, last_name, country, donation, currency, g.user["id"]),
-            )
+            post_id = db.execute(
+                "INSERT INTO post (first_name, last_name, country, donation, currency, email, author_id, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (first_name, last_name, country, donation, currency, email, g.user["id"]),
+            ).lastrowid
+
+            if current_app.config["CERTIFICATE_JOBS"]:
+                # Leave the rendering to `flask run-worker`, in the same commit
+                job_id = enqueue(db, post_id, current_app.config["CERTIFICATE_TEMPLATE"])
+                db.commit()
+                return redirect(url_for("jobs.status_page", id=job_id))
+
             db.commit()
 
-            # Redirect to the generate route with the form data as URL parameters
-            return redirect(
-                url_for(
-                    "pdf.generate_pdf",
-                    first_name=first_name,
-                    last_name=last_name,
-                    country=country,
-                    donation=donation,
-                    currency=currency,
-                )
-            )
+            # The first download renders and stores the certificate
+            return redirect(url_for("pdf.download_pdf", id=post_id))
 
     return render_template("pdf/create.html")
 
@@ -73,7 +196,8 @@ def get_post(id, check_author=True):
     post = (
         get_db()
         .execute(
-            "SELECT p.id, first_name, last_name, country, donation, currency, author_id"
+            "SELECT p.id, first_name, last_name, country, donation, currency, author_id,"
+            " certificate_hash, certificate_key"
             " FROM post p JOIN user u ON p.author_id = u.id"
             " WHERE p.id = ?",
             (id,),
@@ -100,64 +224,111 @@ def generate_pdf():
     donation = request.args.get("donation")
     currency = request.args.get("currency")
 
-    # Generate the PDF using reportlab with the retrieved form data
-    pdf_buffer = generate_pdf_from_data(first_name, last_name, country, donation, currency)
-
-    # Save the PDF to a temporary file
-    cwd = pathlib.Path(__file__).parent
-    pdf_file_path = cwd / f"naturelifecert_{first_name}_{last_name}.pdf"
-    with open(pdf_file_path, "wb") as pdf_file:
-        pdf_file.write(pdf_buffer)
-
-    # Set the PDF file path as a response variable to access it in the after_request function
-    response = make_response(redirect(url_for("index")))
-    response.pdf_file_path = pdf_file_path
-
-    return response
-
-
-# Your route to initiate the PDF download
-@bp.route("/download_pdf", methods=["GET"])
-def download_pdf():
-    # Get the file path of the generated PDF from the response variable
-    pdf_file_path = request.response.pdf_file_path
-
-    # Send the file as a response to initiate the download
-    return send_file(pdf_file_path, as_attachment=True)
+    # The certificate is a pure function of its fields and template, so a
+    # matching ETag is answered before anything is rendered
+    etag = certificate_key(first_name, last_name, country, donation, currency)
+    if request.if_none_match.contains(etag):
+        response = not_modified(etag)
+    else:
+        # Generate the PDF using reportlab with the retrieved form data
+        pdf = get_certificate_pdf(first_name, last_name, country, donation, currency)
+
+        # Stream the bytes straight from memory
+        response = send_file(
+            io.BytesIO(pdf),
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name=f"naturelifecert_{first_name}_{last_name}.pdf",
+            etag=etag,
+            max_age=current_app.config["CERTIFICATE_MAX_AGE"],
+        )
 
+    # The URL carries the donor's name and amount, so shared caches must not keep it
+    return cache_certificate(response)
 
-def generate_pdf_from_data(first_name, last_name, country, donation, currency):
-    buffer = io.BytesIO()
-    pdf_canvas = canvas.Canvas(buffer, pagesize=letter)
 
-    # Add content to the PDF using the form data
-    pdf_canvas.drawString(100, 700, "Form Data:")
-    pdf_canvas.drawString(100, 680, f"First Name: {first_name}")
-    pdf_canvas.drawString(100, 660, f"Last Name: {last_name}")
-    pdf_canvas.drawString(100, 640, f"Country: {country}")
-    pdf_canvas.drawString(100, 620, f"Donation: {donation}")
-    pdf_canvas.drawString(100, 600, f"Currency: {currency}")
-    # Add more content as needed
+# Serve a post's stored certificate, rendering it only the first time
+@bp.route("/download_pdf/<int:id>", methods=["GET"])
+@login_required
+def download_pdf(id):
+    post = get_post(id)
+    store = get_store()
+    fields = (
+        post["first_name"], post["last_name"], post["country"], post["donation"], post["currency"]
+    )
 
-    # Save the PDF
-    pdf_canvas.save()
+    # A stored certificate of another template or template version is stale
+    key = certificate_key(*fields)
+    digest = post["certificate_hash"] if post["certificate_key"] == key else None
+    if digest is not None and request.if_none_match.contains(digest):
+        return cache_certificate(not_modified(digest))
+
+    if digest is None or not store.exists(digest):
+        pdf = get_certificate_pdf(*fields)
+        db = get_db()
+        digest = attach_certificate(db, id, pdf, key)
+        db.commit()
+
+    # A path lets send_file stream from disk with the server's file wrapper,
+    # or hand the file to the front end server when USE_X_SENDFILE is set
+    response = send_file(
+        store.path(digest),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=f"naturelifecert_{post['first_name']}_{post['last_name']}.pdf",
+        etag=digest,
+        max_age=current_app.config["CERTIFICATE_MAX_AGE"],
+    )
+    # Only the author may download it, so shared caches must not keep it
+    return cache_certificate(response)
+
+
+def certificate_key(first_name, last_name, country, donation, currency, template=None):
+    """Content hash identifying a rendered certificate."""
+    # certificate imports reportlab, so load it with the first certificate
+    from naturelifecert import certificate
+
+    values = {
+        "first_name": first_name,
+        "last_name": last_name,
+        "country": country,
+        "donation": donation,
+        "currency": currency,
+    }
+    return certificate.certificate_key(values, template or current_app.config["CERTIFICATE_TEMPLATE"])
+
+
+def get_certificate_pdf(first_name, last_name, country, donation, currency):
+    """Return the certificate PDF bytes, rendering only on a cache miss."""
+    cache = current_app.extensions["pdf_cache"]
+    template = current_app.config["CERTIFICATE_TEMPLATE"]
+    key = certificate_key(first_name, last_name, country, donation, currency, template)
+
+    pdf = cache.get(key)
+    if pdf is None:
+        with timed("pdf_render", template=template):
+            pdf = generate_pdf_from_data(
+                first_name, last_name, country, donation, currency, template
+            )
+        cache.set(key, pdf)
 
-    buffer.seek(0)
-    return buffer.getvalue()
+    return pdf
 
 
-@bp.after_request
-def handle_download_and_redirect(response):
-    # Check if the response has a pdf_file_path attribute
-    if hasattr(response, "pdf_file_path"):
-        # Get the file path of the generated PDF from the response variable
-        pdf_file_path = response.pdf_file_path
+def generate_pdf_from_data(first_name, last_name, country, donation, currency, template="default"):
+    from naturelifecert.certificate import render_certificate
 
-        # Send the file as a response to initiate the download
-        response = send_file(pdf_file_path, as_attachment=True)
+    return render_certificate(
+        {
+            "first_name": first_name,
+            "last_name": last_name,
+            "country": country,
+            "donation": donation,
+            "currency": currency,
+        },
+        template,
+    )
 
-        #delete theh file
-        pathlib.Path(response.pdf_file_path).unlink()
 
-        # Redirect back to the index page after the PDF is downloaded
-    return response
+def init_app(app):
+    app.extensions["pdf_cache"] = LRUCache(max_size=app.config["PDF_CACHE_MAX_BYTES"])
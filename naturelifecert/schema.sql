@@ -1,13 +1,13 @@
-DROP TABLE IF EXISTS user;
-DROP TABLE IF EXISTS post;
+-- Safe to run against an existing database: `flask init-db` drops every
+-- table first, `flask upgrade-db` creates what is missing.
 
-CREATE TABLE user (
+CREATE TABLE IF NOT EXISTS user (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   username TEXT UNIQUE NOT NULL,
   password TEXT NOT NULL
 );
 
-CREATE TABLE post (
+CREATE TABLE IF NOT EXISTS post (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   author_id INTEGER NOT NULL,
   created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -16,5 +16,129 @@ CREATE TABLE post (
   country TEXT NOT NULL,
   donation DECIMAL(10, 2) NOT NULL,
   currency VARCHAR(3) NOT NULL DEFAULT 'EUR',
-  FOREIGN KEY (author_id) REFERENCES user (id)
-);
\ No newline at end of file
+  email TEXT,
+  certificate_hash TEXT,
+  -- certificate_key() of the stored certificate: its template, version and fields
+  certificate_key TEXT,
+  FOREIGN KEY (author_id) REFERENCES user (id),
+  FOREIGN KEY (certificate_hash) REFERENCES certificate (hash)
+);
+
+-- A counter bumped by every change to a post field the index shows, so
+-- the index ETag notices edits as well as new and deleted posts.
+CREATE TABLE IF NOT EXISTS post_changes (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL,
+  changed TIMESTAMP
+);
+
+INSERT OR IGNORE INTO post_changes (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS post_changes_insert AFTER INSERT ON post
+BEGIN
+  UPDATE post_changes SET version = version + 1, changed = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_changes_delete AFTER DELETE ON post
+BEGIN
+  UPDATE post_changes SET version = version + 1, changed = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_changes_update
+AFTER UPDATE OF author_id, created, first_name, last_name, country, donation, currency ON post
+BEGIN
+  UPDATE post_changes SET version = version + 1, changed = CURRENT_TIMESTAMP;
+END;
+
+-- Donation count and sum per country, currency and month, kept up to date
+-- by the triggers below so the stats pages never scan post.
+-- `flask rebuild-rollups` recomputes it from scratch.
+CREATE TABLE IF NOT EXISTS donation_rollup (
+  country TEXT NOT NULL,
+  currency VARCHAR(3) NOT NULL,
+  month TEXT NOT NULL,
+  donations INTEGER NOT NULL,
+  total DECIMAL(14, 2) NOT NULL,
+  PRIMARY KEY (country, currency, month)
+);
+
+CREATE TRIGGER IF NOT EXISTS post_rollup_insert AFTER INSERT ON post
+BEGIN
+  INSERT INTO donation_rollup (country, currency, month, donations, total)
+  VALUES (NEW.country, NEW.currency, strftime('%Y-%m', NEW.created), 1, NEW.donation)
+  ON CONFLICT (country, currency, month) DO UPDATE
+  SET donations = donations + 1, total = total + excluded.total;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_rollup_delete AFTER DELETE ON post
+BEGIN
+  UPDATE donation_rollup SET donations = donations - 1, total = total - OLD.donation
+  WHERE country = OLD.country AND currency = OLD.currency AND month = strftime('%Y-%m', OLD.created);
+  DELETE FROM donation_rollup
+  WHERE country = OLD.country AND currency = OLD.currency AND month = strftime('%Y-%m', OLD.created)
+  AND donations = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS post_rollup_update AFTER UPDATE OF country, currency, donation, created ON post
+BEGIN
+  UPDATE donation_rollup SET donations = donations - 1, total = total - OLD.donation
+  WHERE country = OLD.country AND currency = OLD.currency AND month = strftime('%Y-%m', OLD.created);
+  DELETE FROM donation_rollup
+  WHERE country = OLD.country AND currency = OLD.currency AND month = strftime('%Y-%m', OLD.created)
+  AND donations = 0;
+  INSERT INTO donation_rollup (country, currency, month, donations, total)
+  VALUES (NEW.country, NEW.currency, strftime('%Y-%m', NEW.created), 1, NEW.donation)
+  ON CONFLICT (country, currency, month) DO UPDATE
+  SET donations = donations + 1, total = total + excluded.total;
+END;
+
+-- Rendered certificates; the PDF itself is kept in CERTIFICATE_STORE
+CREATE TABLE IF NOT EXISTS certificate (
+  hash TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keyset pagination on the index view walks these newest-first.
+CREATE INDEX IF NOT EXISTS post_created_id ON post (created, id);
+CREATE INDEX IF NOT EXISTS post_country_created_id ON post (country, created, id);
+CREATE INDEX IF NOT EXISTS post_currency_created_id ON post (currency, created, id);
+
+-- Incremental sync state of the donation mailbox checked by outlook_check
+CREATE TABLE IF NOT EXISTS mailbox_sync (
+  mailbox TEXT PRIMARY KEY,
+  uidvalidity INTEGER NOT NULL,
+  last_uid INTEGER NOT NULL DEFAULT 0
+);
+
+-- Donation emails a certificate was already sent for
+CREATE TABLE IF NOT EXISTS certificated_email (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  mailbox TEXT NOT NULL,
+  uidvalidity INTEGER NOT NULL,
+  uid INTEGER NOT NULL,
+  message_id TEXT,
+  email TEXT NOT NULL,
+  sent TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (mailbox, uidvalidity, uid)
+);
+CREATE INDEX IF NOT EXISTS certificated_email_message_id ON certificated_email (message_id);
+
+-- Certificates rendered in the background by `flask run-worker`
+CREATE TABLE IF NOT EXISTS job (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  post_id INTEGER NOT NULL,
+  template TEXT NOT NULL,
+  -- queued, running, done or failed
+  status TEXT NOT NULL DEFAULT 'queued',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  error TEXT,
+  certificate_hash TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  started TIMESTAMP,
+  finished TIMESTAMP,
+  FOREIGN KEY (post_id) REFERENCES post (id),
+  FOREIGN KEY (certificate_hash) REFERENCES certificate (hash)
+);
+-- Workers claim the oldest queued job first
+CREATE INDEX IF NOT EXISTS job_status_id ON job (status, id);
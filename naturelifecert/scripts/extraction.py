@@ -0,0 +1,376 @@
+import functools
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+# Building blocks shared by the rule sets below
+AMOUNT = r"(?P<amount>\d+(?:[.,' \u00a0]\d+)*)"
+SYMBOL = r"(?P<symbol>US\$|A\$|C\$|[€$£¥])"
+# codes are upper case even though the rules match case-insensitively
+CODE = r"(?P<currency>(?-i:[A-Z]{3}))\b"
+EMAIL = r"(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+WORD = r"[^\W\d_](?:[^\W\d_]|['.-])*"
+NAME = r"(?P<name>" + WORD + r"(?:[^\S\n]+" + WORD + r")+)"
+LINE = r"[^\S\n]*(?P<{}>[^\n]+?)[^\S\n]*$"
+
+SENDER_DOMAIN = re.compile(r"@([\w.-]+)>?\s*$")
+
+CURRENCY_SYMBOLS = {
+    "€": "EUR",
+    "$": "USD",
+    "US$": "USD",
+    "A$": "AUD",
+    "C$": "CAD",
+    "£": "GBP",
+    "¥": "JPY",
+}
+
+# Lower case words that start a last name, e.g. "van Dijk"
+NAME_PARTICLES = frozenset(["van", "von", "de", "der", "den", "da", "di", "del", "du", "la", "le", "ten", "ter"])
+
+REQUIRED = ("first_name", "last_name", "amount", "currency", "email")
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """
+    Extraction rules for the emails of one sender or payment provider.
+
+    Args:
+        name (str): The rule set name.
+        domains (tuple): Sender domains handled by these rules; subdomains match too.
+        patterns (tuple): Regular expressions searched, in order, over the
+            subject and text. Their named groups (``name``, ``first_name``,
+            ``last_name``, ``amount``, ``symbol``, ``currency``, ``country``,
+            ``email``) fill the fields; the first pattern to find a field wins.
+        defaults (tuple): ``(field, value)`` pairs for fields no pattern found,
+            e.g. the currency of a provider that only pays out in one.
+        unlabeled (tuple): Patterns tried after all others that match an
+            ``email`` anywhere in the text; addresses at the sender's domain or
+            a provider's domain (e.g. a no-reply address) are skipped.
+    """
+    name: str
+    domains: tuple = ()
+    patterns: tuple = ()
+    defaults: tuple = ()
+    unlabeled: tuple = ()
+
+
+class CompiledRules:
+    """
+    A rule set with its regular expressions compiled.
+
+    Args:
+        rule_set (RuleSet): The rules to compile.
+        fallback (RuleSet): Rules tried after these for fields still missing.
+    """
+
+    def __init__(self, rule_set: RuleSet, fallback: RuleSet = None):
+        self.name = rule_set.name
+        rule_sets = (rule_set, fallback) if fallback else (rule_set,)
+        self.patterns = tuple(
+            (re.compile(pattern, re.M | re.I), unlabeled)
+            for unlabeled in (False, True)
+            for rules in rule_sets
+            for pattern in (rules.unlabeled if unlabeled else rules.patterns)
+        )
+        self.defaults = dict((fallback.defaults if fallback else ()) + rule_set.defaults)
+
+    def search(self, text: str, excluded: tuple = ()) -> dict:
+        """
+        Collect the raw field values found in ``text``.
+
+        Args:
+            text (str): The subject and body of the email.
+            excluded (tuple): Domains whose addresses unlabeled patterns skip.
+
+        Returns:
+            dict: Matched group values by group name.
+        """
+        found = {}
+        for regex, unlabeled in self.patterns:
+            if unlabeled and excluded:
+                match = next(
+                    (m for m in regex.finditer(text) if not _at_domain(m.group("email"), excluded)),
+                    None,
+                )
+            else:
+                match = regex.search(text)
+            if match is None:
+                continue
+            for group, value in match.groupdict().items():
+                if value and group not in found:
+                    found[group] = value
+            if _complete(found):
+                break
+        return found
+
+    def extract(self, subject: str, text: str, excluded: tuple = ()):
+        """
+        Extract the normalized donation details from an email.
+
+        Args:
+            subject (str): The email subject.
+            text (str): The email text.
+            excluded (tuple): Domains whose addresses unlabeled patterns skip.
+
+        Returns:
+            dict or None: ``first_name``, ``last_name``, ``amount`` (Decimal),
+            ``currency`` (ISO 4217 code), ``country`` and ``email``, or None
+            when a required field could not be found.
+        """
+        found = self.search(f"{subject}\n{text}", excluded)
+
+        first_name, last_name = found.get("first_name"), found.get("last_name")
+        if not (first_name and last_name) and found.get("name"):
+            first_name, last_name = split_name(found["name"])
+
+        info = {
+            "first_name": clean(first_name),
+            "last_name": clean(last_name),
+            "amount": normalize_amount(found.get("amount")),
+            "currency": normalize_currency(found.get("currency") or found.get("symbol")),
+            "country": clean(found.get("country")),
+            "email": found["email"].lower() if "email" in found else None,
+        }
+        for key, value in self.defaults.items():
+            if not info[key]:
+                info[key] = value
+
+        if any(not info[key] for key in REQUIRED):
+            return None
+        info["country"] = info["country"] or ""
+        return info
+
+
+class ExtractionEngine:
+    """
+    Dispatch emails to the rule set of their sender's domain.
+
+    Args:
+        rule_sets (iterable): The ``RuleSet`` objects for known senders.
+        fallback (RuleSet): Rules for senders no rule set claims; they are
+            also tried after a sender's own rules for any missing field.
+    """
+
+    def __init__(self, rule_sets, fallback: RuleSet):
+        self.fallback = CompiledRules(fallback)
+        self._by_domain = {}
+        rule_sets = tuple(rule_sets)
+        self.provider_domains = tuple(domain.lower() for rule_set in rule_sets for domain in rule_set.domains)
+        for rule_set in rule_sets:
+            compiled = CompiledRules(rule_set, fallback)
+            for domain in rule_set.domains:
+                self._by_domain[domain.lower()] = compiled
+
+    def rules_for(self, sender: str) -> CompiledRules:
+        """
+        Find the rules for a sender, e.g. ``PayPal <service@mail.paypal.com>``.
+
+        Args:
+            sender (str): The From header.
+
+        Returns:
+            CompiledRules: The rules of the sender's domain or a parent domain.
+        """
+        domain = sender_domain(sender)
+        while domain:
+            rules = self._by_domain.get(domain)
+            if rules is not None:
+                return rules
+            domain = domain.partition(".")[2]
+        return self.fallback
+
+    def extract(self, sender: str, subject: str, text: str):
+        """
+        Extract the donation details of an email.
+
+        Args:
+            sender (str): The From header.
+            subject (str): The email subject.
+            text (str): The email text.
+
+        Returns:
+            dict or None: See ``CompiledRules.extract``.
+        """
+        domain = sender_domain(sender)
+        labels = domain.split(".")
+        if len(labels) >= 3 and len(labels[-2]) > 3:
+            # mail.example.org also speaks for example.org, but keep co.uk and the like
+            domain = ".".join(labels[-2:])
+        excluded = self.provider_domains + ((domain,) if domain else ())
+        return self.rules_for(sender).extract(subject, text, excluded)
+
+
+def _complete(found: dict) -> bool:
+    # every field has a value, so later (fallback) patterns cannot add anything
+    return (
+        "amount" in found and "email" in found and "country" in found
+        and ("currency" in found or "symbol" in found)
+        and ("name" in found or ("first_name" in found and "last_name" in found))
+    )
+
+
+def sender_domain(sender: str) -> str:
+    """
+    The lower case domain of a From header.
+
+    Args:
+        sender (str): e.g. ``PayPal <service@mail.paypal.com>``.
+
+    Returns:
+        str: e.g. ``mail.paypal.com``, or an empty string.
+    """
+    # a regex is much cheaper than email.utils.parseaddr for this
+    match = SENDER_DOMAIN.search(sender)
+    return match.group(1).lower() if match else ""
+
+
+def _at_domain(address: str, domains: tuple) -> bool:
+    domain = address.rpartition("@")[2].lower()
+    return any(domain == other or domain.endswith("." + other) for other in domains)
+
+
+def clean(value):
+    """Collapse whitespace and strip surrounding punctuation from a field."""
+    if not value:
+        return None
+    return " ".join(value.split()).strip(" .,;:()<>\"'") or None
+
+
+def split_name(name: str) -> tuple:
+    """
+    Split a full name into first and last name.
+
+    The last name starts at the first lower case particle such as ``van``
+    or ``de``, otherwise it is the last word.
+
+    Args:
+        name (str): e.g. ``Ada King Lovelace`` or ``Marie van Dijk``.
+
+    Returns:
+        tuple: e.g. ``('Ada King', 'Lovelace')`` or ``('Marie', 'van Dijk')``;
+        the last name is None for a single word.
+    """
+    parts = name.split()
+    if len(parts) < 2:
+        return (parts[0] if parts else None), None
+    split = next((i for i, part in enumerate(parts[1:-1], 1) if part in NAME_PARTICLES), len(parts) - 1)
+    return " ".join(parts[:split]), " ".join(parts[split:])
+
+
+def normalize_amount(amount: str):
+    """
+    Parse an amount written with either decimal separator.
+
+    The last ``.`` or ``,`` is the decimal separator when both are used.
+    A single separator followed by exactly three digits groups thousands,
+    any other single separator marks the decimals. Spaces and apostrophes
+    always group thousands.
+
+    Args:
+        amount (str): e.g. ``1.234,56``, ``1,234.56``, ``1'234.50`` or ``20,00``.
+
+    Returns:
+        Decimal or None: The amount, or None if it is not a number.
+    """
+    if not amount:
+        return None
+    amount = re.sub(r"[\s']", "", amount)
+
+    separators = [char for char in amount if char in ".,"]
+    if separators:
+        decimal = separators[-1]
+        integer, _, fraction = amount.rpartition(decimal)
+        if len(set(separators)) == 1 and (len(separators) > 1 or len(fraction) == 3):
+            # only thousands groups, e.g. 1.000 or 1,000,000
+            integer, fraction = amount, ""
+        amount = re.sub(r"[.,]", "", integer) + ("." + fraction if fraction else "")
+
+    try:
+        return Decimal(amount)
+    except InvalidOperation:
+        return None
+
+
+def normalize_currency(currency: str):
+    """
+    Map a currency symbol or code to its ISO 4217 code.
+
+    Args:
+        currency (str): e.g. ``€``, ``US$`` or ``eur``.
+
+    Returns:
+        str or None: e.g. ``EUR``, or None if it is not recognised.
+    """
+    if not currency:
+        return None
+    currency = currency.strip()
+    if currency in CURRENCY_SYMBOLS:
+        return CURRENCY_SYMBOLS[currency]
+    if len(currency) == 3 and currency.isalpha():
+        return currency.upper()
+    return None
+
+
+RULE_SETS = (
+    RuleSet(
+        name="paypal",
+        domains=("paypal.com", "paypal.de", "paypal.co.uk"),
+        patterns=(
+            # "Ada Lovelace sent you €20.00 EUR"
+            r"^[^\S\n]*" + NAME + r"[^\S\n]+sent you[^\S\n]+" + SYMBOL + r"?\s*" + AMOUNT + r"\s*" + CODE,
+            r"^\s*(?:Donor|Contributor)(?: name)?:" + LINE.format("name"),
+            r"^\s*(?:Donor |Contributor )?e-?mail(?: address)?:\s*" + EMAIL,
+            r"^\s*(?:Donor |Contributor )?country:" + LINE.format("country"),
+        ),
+    ),
+    RuleSet(
+        name="stripe",
+        domains=("stripe.com",),
+        patterns=(
+            # "Amount paid: €1.234,56" or "Amount paid: 25.00 USD"
+            r"^\s*Amount(?: paid)?:\s*" + SYMBOL + r"?\s*" + AMOUNT + r"(?:\s*" + CODE + ")?",
+            r"^\s*(?:Customer |Cardholder )?name:" + LINE.format("name"),
+            r"^\s*(?:Customer )?e-?mail:\s*" + EMAIL,
+            r"^\s*(?:Billing )?country:" + LINE.format("country"),
+        ),
+    ),
+    RuleSet(
+        name="justgiving",
+        domains=("justgiving.com",),
+        patterns=(
+            # "You have received a donation of £15.00 from Grace Hopper (grace@example.org)"
+            r"donation of\s*" + SYMBOL + r"?\s*" + AMOUNT + r"(?:[^\S\n]*" + CODE + r")?\s+from\s+"
+            + NAME + r"\s*\(\s*" + EMAIL + r"\s*\)",
+            r"^\s*country:" + LINE.format("country"),
+        ),
+        defaults=(("currency", "GBP"),),
+    ),
+)
+
+FALLBACK = RuleSet(
+    name="generic",
+    patterns=(
+        r"^\s*(?:First name|Vorname|Pr[ée]nom):" + LINE.format("first_name"),
+        r"^\s*(?:Last name|Surname|Nachname|Nom):" + LINE.format("last_name"),
+        r"^\s*(?:Donation|Amount|Betrag|Montant):\s*" + SYMBOL + r"?\s*" + AMOUNT + r"(?:[^\S\n]*" + CODE + ")?",
+        r"(?:^|\s)" + SYMBOL + r"\s*" + AMOUNT,
+        r"\b" + AMOUNT + r"[^\S\n]*" + CODE,
+        r"^\s*(?:Country|Land|Pays):" + LINE.format("country"),
+        r"^\s*(?:E-?mail|E-?mail address):\s*" + EMAIL,
+        r"^[^\S\n]*Donation from[^\S\n]+" + NAME + r"[^\S\n]*$",
+    ),
+    unlabeled=(EMAIL,),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine() -> ExtractionEngine:
+    """
+    Compile the built-in rule sets once per process.
+
+    Returns:
+        ExtractionEngine: The engine for ``RULE_SETS`` and ``FALLBACK``.
+    """
+    return ExtractionEngine(RULE_SETS, FALLBACK)
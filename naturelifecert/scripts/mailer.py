@@ -0,0 +1,178 @@
+import queue
+import smtplib
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    A token bucket allowing ``per_minute`` sends per minute on average.
+
+    Args:
+        per_minute (float): The sending budget; None means unlimited.
+    """
+
+    def __init__(self, per_minute: float = None):
+        self.per_minute = per_minute
+        self._tokens = max(1.0, per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until the budget allows another send."""
+        if not self.per_minute:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                capacity = max(1.0, self.per_minute)
+                self._tokens = min(capacity, self._tokens + (now - self._updated) * self.per_minute / 60)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * 60 / self.per_minute
+            time.sleep(wait)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Whether a failed send is worth another attempt on a fresh connection.
+
+    Args:
+        exc (BaseException): The error raised while sending.
+
+    Returns:
+        bool: True for dropped connections and transient (4xx) replies.
+    """
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError))
+
+
+class SMTPPool:
+    """
+    Keep authenticated SMTP sessions open and send many messages per session.
+
+    Opening a session costs a TCP connect, the STARTTLS handshake and a login,
+    which dominates the cost of sending one small message. Sessions are
+    reused until ``max_messages`` have gone through them, dropped sessions
+    are reopened, and failed sends are retried with exponential backoff.
+
+    Args:
+        host (str): The SMTP server.
+        port (int): The SMTP port.
+        username (str): The login, or None to skip authentication.
+        password (str): The password to log in with.
+        starttls (bool): Whether to upgrade the connection with STARTTLS.
+        size (int): The most sessions open at once.
+        per_minute (float): Sending budget across all sessions; None for no limit.
+        max_messages (int): Messages sent before a session is recycled.
+        retries (int): Extra attempts for a message after a connection failure.
+        backoff (float): Seconds to wait before the first retry, doubled each time.
+        timeout (float): Socket timeout for the SMTP connections.
+        smtp_factory (callable): Creates the connection, ``smtplib.SMTP`` by default.
+    """
+
+    def __init__(self, host: str, port: int = 587, username: str = None, password: str = None,
+                 starttls: bool = True, size: int = 2, per_minute: float = None,
+                 max_messages: int = 100, retries: int = 3, backoff: float = 1.0,
+                 timeout: float = 30, smtp_factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.max_messages = max_messages
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self.limiter = RateLimiter(per_minute)
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, msg, from_addr: str, to_addrs) -> None:
+        """
+        Send a message, reconnecting and retrying on connection failures.
+
+        Args:
+            msg (email.message.Message): The message to send.
+            from_addr (str): The envelope sender.
+            to_addrs (str or list): The envelope recipients.
+        """
+        payload = msg.as_string()
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                with self._slots:
+                    self._send_once(from_addr, to_addrs, payload)
+                return
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self) -> None:
+        """Log out of every idle session."""
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(session)
+
+    def _send_once(self, from_addr: str, to_addrs, payload: str) -> None:
+        while True:
+            try:
+                session, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                session, reused = self._connect(), False
+
+            try:
+                session[0].sendmail(from_addr, to_addrs, payload)
+            except smtplib.SMTPServerDisconnected:
+                self._discard(session)
+                if reused:
+                    # the server timed out an idle session, just open another
+                    continue
+                raise
+            except BaseException:
+                self._discard(session)
+                raise
+            break
+
+        session[1] += 1
+        if session[1] >= self.max_messages:
+            self._discard(session)
+        else:
+            self._idle.put(session)
+
+    def _connect(self) -> list:
+        smtp = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self.connections_opened += 1
+        # [connection, messages sent through it]
+        return [smtp, 0]
+
+    @staticmethod
+    def _discard(session: list) -> None:
+        try:
+            session[0].quit()
+        except (smtplib.SMTPException, OSError):
+            session[0].close()
@@ -1,13 +1,27 @@
+import base64
+import email.message
+import html
 import imaplib
-import email
-from email.header import decode_header
-from bs4 import BeautifulSoup
+import queue
+import quopri
+import re
+import threading
+import time
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
 import click
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from naturelifecert import create_app
+from naturelifecert.certificate import render_certificate
+from naturelifecert.db import get_db
+from naturelifecert.scripts.extraction import get_engine
+from naturelifecert.scripts.mailer import SMTPPool
+from naturelifecert.scripts.sync import MailboxSync
 
 
 @dataclass
@@ -15,31 +29,63 @@ class DonationCertCreator:
     """
     A class to generate a donation certificate.
 
+    Certificates are rendered in memory with the web app's compiled
+    certificate templates, see ``naturelifecert.certificate``.
+
     Args:
         first_name (str): The first name of the donor.
         last_name (str): The last name of the donor.
-        amount (float): The amount donated.
+        amount (Decimal): The amount donated.
         email (str): The email address of the donor.
+        currency (str): The ISO 4217 code of the amount.
+        country (str): The country of the donor.
+        template (str): The name of the certificate template.
 
     Attributes:
         first_name (str): The first name of the donor.
         last_name (str): The last name of the donor.
-        amount (float): The amount donated.
+        amount (Decimal): The amount donated.
         email (str): The email address of the donor.
+        currency (str): The ISO 4217 code of the amount.
+        country (str): The country of the donor.
+        template (str): The name of the certificate template.
     """
     first_name: str
     last_name: str
-    amount: float
+    amount: Decimal
     email: str
+    currency: str = 'EUR'
+    country: str = ''
+    template: str = 'default'
+
+    @property
+    def filename(self) -> str:
+        """The attachment name, the same as the web app's download name."""
+        return f'naturelifecert_{self.first_name}_{self.last_name}.pdf'
 
-    def generate_pdf(self) -> str:
+    def values(self) -> dict:
+        """
+        The certificate template fields for this donation.
+
+        Returns:
+            dict: The values to stamp on the certificate.
+        """
+        return {
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'country': self.country,
+            'donation': f'{Decimal(self.amount):.2f}',
+            'currency': self.currency,
+        }
+
+    def generate_pdf(self) -> bytes:
         """
         Generate a PDF of the donation certificate.
 
         Returns:
-            str: The path to the PDF file.
+            bytes: The PDF.
         """
-        return 'path_to_pdf'
+        return render_certificate(self.values(), self.template)
 
 
 @dataclass
@@ -61,134 +107,380 @@ class EmailParser:
     subject: str
     text: str
 
-    def extract_info(self) -> dict:
+    def extract_info(self):
         """
-        Extract information from the email.
+        Extract the donation details from the email.
+
+        The rules are picked by the sender's domain, see ``extraction.RULE_SETS``.
 
         Returns:
-            dict: A dictionary containing the extracted information.
+            dict or None: ``first_name``, ``last_name``, ``amount``, ``currency``,
+            ``country`` and ``email``, or None if the email is not a donation
+            the rules understand.
         """
-        #write some function to extact the info
-        return {'FirstName': first_name,
-                'LastName': last_name,}
+        return get_engine().extract(self.sender, self.subject, self.text)
 
 
-def send_mail(username: str, password: str, email_address: str, path_to_pdf: str) -> None:
+def send_mail(pool: SMTPPool, sender: str, email_address: str, pdf: bytes,
+              filename: str = 'naturelifecert.pdf') -> None:
     """
     Send a thank you email with a PDF attachment.
 
     Args:
-        username (str): The username of the outlook account.
-        password (str): The password to connect with.
+        pool (SMTPPool): The open SMTP sessions to send through.
+        sender (str): The address the email is sent from.
         email_address (str): The email address of the recipient.
-        path_to_pdf (str): The path to the PDF file to attach.
+        pdf (bytes): The PDF to attach.
+        filename (str): The name of the attachment.
     """
     # create message object instance
     msg = MIMEMultipart()
 
     # setup the parameters of the message
-    msg['From'] = username
+    msg['From'] = sender
     msg['To'] = email_address
     msg['Subject'] = "Thank you for your donation"
 
-    # attach the pdf file
-    with open(path_to_pdf, "rb") as f:
-        attach = MIMEApplication(f.read(), _subtype="pdf")
-        attach.add_header('Content-Disposition', 'attachment', filename=path_to_pdf)
-        msg.attach(attach)
+    # attach the pdf straight from memory
+    attach = MIMEApplication(pdf, _subtype="pdf")
+    attach.add_header('Content-Disposition', 'attachment', filename=filename)
+    msg.attach(attach)
+
+    # send the message through one of the pooled sessions
+    pool.send(msg, sender, email_address)
 
-    # send the message via the server.
-    server = smtplib.SMTP('smtp.office365.com', 587)
-    server.starttls()
-    # Login Credentials for sending the mail
-    server.login(username, password)
+# Largest decoded text part looked at; the rest of a huge part is never read
+MAX_PART_BYTES = 64 * 1024
 
-    # send the message via the server.
-    server.sendmail(username, email_address, msg.as_string())
+_HTML_DROP = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->', re.S | re.I)
+_HTML_BREAK = re.compile(r'<(?:br|/p|/div|/tr|/li|/h[1-6])\b[^>]*>', re.I)
+_HTML_TAG = re.compile(r'<[^>]*>')
+_BLANK_LINES = re.compile(r'[ \t]*\n\s*\n\s*')
 
-    # terminating the session
-    server.quit()
 
-def extract_text_from_email_payload(payload: str) -> str:
+def html_to_text(markup: str) -> str:
     """
-    Extract text from an email payload.
+    Strip HTML down to its text with a few regular expressions.
 
     Args:
-        payload (str): The email payload.
+        markup (str): The HTML.
+
+    Returns:
+        str: The text, with block elements turned into line breaks.
+    """
+    text = _HTML_DROP.sub('', markup)
+    text = _HTML_BREAK.sub('\n', text)
+    text = html.unescape(_HTML_TAG.sub('', text))
+    return _BLANK_LINES.sub('\n', text).strip()
+
+
+def _part_bytes(part, max_bytes: int) -> bytes:
+    """
+    Decode the Content-Transfer-Encoding of at most ``max_bytes`` of a part.
+
+    Args:
+        part (email.message.Message): A non-multipart message part.
+        max_bytes (int): The most decoded bytes to return.
+
+    Returns:
+        bytes: The start of the decoded payload.
+    """
+    encoded = part.get_payload()
+    encoding = part.get('Content-Transfer-Encoding', '').strip().lower()
+    if encoding == 'base64':
+        # 4 characters per 3 bytes, plus line breaks
+        encoded = ''.join(encoded[:max_bytes * 2].split())
+        return base64.b64decode(encoded[:len(encoded) // 4 * 4])[:max_bytes]
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(encoded[:max_bytes * 3].encode('ascii', 'replace'))[:max_bytes]
+    # 7bit/8bit bodies come back from the parser as surrogate-escaped text
+    return encoded[:max_bytes].encode('utf-8', 'surrogateescape')
+
+
+def _part_text(part, max_bytes: int) -> str:
+    charset = part.get_content_charset() or 'utf-8'
+    data = _part_bytes(part, max_bytes)
+    try:
+        return data.decode(charset, errors='replace')
+    except LookupError:
+        # unknown charset name
+        return data.decode('utf-8', errors='replace')
+
+
+def extract_text_from_email_payload(payload, max_bytes: int = MAX_PART_BYTES) -> str:
+    """
+    Extract text from an email.
+
+    The text/plain parts are used when there are any, otherwise the
+    text/html parts are stripped to text. Attachments and other content
+    types are skipped without being decoded, and at most ``max_bytes`` of
+    each text part are decoded, using its declared charset.
+
+    Args:
+        payload (email.message.Message, list, bytes or str): The email, a
+            list of its parts, or an already decoded body.
+        max_bytes (int): The most bytes decoded per text part.
 
     Returns:
         str: The extracted text.
     """
-    if isinstance(payload, list):
-        # if multiple parts, recursively call the function on each part
-        text_content = ''.join(extract_text_from_email_payload(part.get_payload()) for part in payload)
-    else:
-        # decode the payload as bytes and then parse with BeautifulSoup to extract text
-        try:
-            # decode the payload if it's a bytes object, then parse with BeautifulSoup to extract text
-            if isinstance(payload, bytes):
-                payload_text = payload.decode(errors='ignore')
-                soup = BeautifulSoup(payload_text, 'html.parser')
-                text_content = soup.get_text()
-            else:
-                # if it's not bytes, it's probably already a string, so we don't need to decode
-                text_content = payload
-        except Exception as e:
-            # handle any exceptions that might occur during parsing
-            print(f"Error extracting text from payload: {e}")
-            text_content = ''
-    return text_content
+    if isinstance(payload, (bytes, str)):
+        if isinstance(payload, bytes):
+            payload = payload[:max_bytes].decode(errors='replace')
+        return html_to_text(payload) if '<' in payload else payload
+
+    parts = payload.walk() if isinstance(payload, email.message.Message) else (
+        sub_part for part in payload for sub_part in part.walk()
+    )
+    plain, markup = [], []
+    for part in parts:
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            plain.append(part)
+        elif content_type == 'text/html' and not plain:
+            markup.append(part)
+
+    if plain:
+        return '\n'.join(_part_text(part, max_bytes) for part in plain)
+    return '\n'.join(html_to_text(_part_text(part, max_bytes)) for part in markup)
+
+
+def parse_email(raw: bytes) -> EmailParser:
+    """
+    Parse a raw RFC822 message.
 
+    Args:
+        raw (bytes): The message as fetched from the server.
+
+    Returns:
+        EmailParser: The sender, subject and text of the email.
+    """
+    # parse a bytes email into a message object
+    msg = email.message_from_bytes(raw)
+
+    # decode the (possibly RFC 2047 encoded) subject and sender
+    subject = str(make_header(decode_header(msg['Subject'] or '')))
+    sender = str(make_header(decode_header(msg['From'] or '')))
 
-def extract_info_from_email(imap, mail) -> dict:
+    # extract text from the email body
+    text_content = extract_text_from_email_payload(msg)
+
+    return EmailParser(sender=sender, subject=subject, text=text_content)
+
+
+def sequence_set(uids: list) -> str:
     """
-    Extract information from an email.
+    Build a compact IMAP sequence set, e.g. [1, 2, 3, 7] -> "1:3,7".
 
     Args:
-        imap (imaplib.IMAP4): The IMAP4 object.
-        mail (bytes): The email ID.
+        uids (list): Sorted message UIDs.
 
     Returns:
-        dict: A dictionary containing the extracted information.
+        str: The sequence set.
     """
-    # fetch the email message by ID
-    res, msg = imap.fetch(mail, "(RFC822)")
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(a) if a == b else f'{a}:{b}' for a, b in ranges)
 
-    for response in msg:
-        if isinstance(response, tuple):
-            # parse a bytes email into a message object
-            msg = email.message_from_bytes(response[1])
 
-            # decode the email subject and sender
-            subject = decode_header(msg["Subject"])[0][0]
-            # if isinstance(subject, bytes):
-            #     # if it's a bytes type, decode to str
-            #     subject = subject.decode()
-            sender = decode_header(msg["From"])[0][0]
-            if isinstance(sender, bytes):
-                # if it's a bytes type, decode to str
-                sender = sender.decode()
+def fetch_messages(imap, uids: list, batch_size: int = 100):
+    """
+    Fetch messages with one UID FETCH round trip per batch.
 
-            # extract text from the email payload
-            payload = msg.get_payload()
-            text_content = extract_text_from_email_payload(payload)
+    Args:
+        imap (imaplib.IMAP4): The IMAP4 object, with a mailbox selected.
+        uids (list): The message UIDs to fetch.
+        batch_size (int): How many messages to request per round trip.
+
+    Yields:
+        tuple: ``(uid, raw)`` for every fetched message.
+    """
+    uids = sorted(uids)
+    for i in range(0, len(uids), batch_size):
+        status, data = imap.uid('FETCH', sequence_set(uids[i:i + batch_size]), '(UID RFC822)')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f'UID FETCH failed: {data}')
+
+        for response in data:
+            if isinstance(response, tuple):
+                uid = int(re.search(rb'UID (\d+)', response[0]).group(1))
+                yield uid, response[1]
+
+
+@dataclass
+class StageStats:
+    """
+    Counters for one pipeline stage.
+
+    Attributes:
+        items (int): Items the stage finished.
+        errors (int): Items the stage failed on.
+        seconds (float): Time spent inside the stage, summed over workers.
+    """
+    items: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+
+_DONE = object()
+
+
+@dataclass
+class Pipeline:
+    """
+    Run items through stages of worker threads joined by bounded queues.
+
+    Each stage is a ``(name, func, workers)`` tuple. ``func`` gets the output
+    of the previous stage; returning None drops the item. Exceptions are
+    counted and reported, and the item is dropped. The bounded queues keep a
+    slow stage from letting the ones before it run arbitrarily far ahead.
+
+    Args:
+        stages (list): The ``(name, func, workers)`` stages, in order.
+        queue_size (int): Capacity of the queue in front of every stage.
+    """
+    stages: list
+    queue_size: int = 100
+    stats: dict = field(default_factory=dict)
+
+    def run(self, items, source: str = 'fetch') -> dict:
+        """
+        Feed ``items`` through the stages and wait for all of them to finish.
+
+        Args:
+            items (iterable): The input items; time spent producing them is
+                recorded under ``source``.
+            source (str): The stage name for the producer.
+
+        Returns:
+            dict: ``StageStats`` by stage name, plus the wall time under
+            ``'total'``.
+        """
+        self.stats = {source: StageStats()}
+        self.stats.update((name, StageStats()) for name, _, _ in self.stages)
+        self._lock = threading.Lock()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._running = [workers for _, _, workers in self.stages]
+
+        threads = []
+        for index, (name, func, workers) in enumerate(self.stages):
+            for _ in range(workers):
+                thread = threading.Thread(target=self._work, args=(index, queues), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        start = time.perf_counter()
+        items = iter(items)
+        while True:
+            fetch_start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            self._record(source, fetch_start)
+            queues[0].put(item)
+
+        for _ in range(self.stages[0][2]):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+
+        self.stats['total'] = StageStats(
+            items=self.stats[source].items, seconds=time.perf_counter() - start
+        )
+        return self.stats
+
+    def _work(self, index: int, queues: list) -> None:
+        name, func, _ = self.stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except Exception as e:
+                self._record(name, start, error=True)
+                print(f'{name} failed: {e}')
+                continue
+            self._record(name, start)
+
+            if outbox is not None and result is not None:
+                outbox.put(result)
+
+        # the last worker of a stage tells the next stage it is done
+        with self._lock:
+            self._running[index] -= 1
+            last = self._running[index] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1][2]):
+                outbox.put(_DONE)
+
+    def _record(self, name: str, start: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self.stats[name]
+            stats.seconds += time.perf_counter() - start
+            if error:
+                stats.errors += 1
+            else:
+                stats.items += 1
 
-            # extract information from the email using the EmailParser class
-            info = EmailParser(sender=sender, subject=subject, text=text_content)
 
-            return info
+def report_stats(stats: dict) -> None:
+    """
+    Print how long each pipeline stage took.
+
+    Args:
+        stats (dict): The result of ``Pipeline.run``.
+    """
+    for name, stage in stats.items():
+        average = stage.seconds / stage.items * 1000 if stage.items else 0.0
+        print(f'{name:>8}: {stage.items} ok, {stage.errors} failed, '
+              f'{stage.seconds:.2f}s ({average:.1f}ms per item)')
 
 
 @click.command()
 @click.option('--username', '-n', default='USERNAME', help='The username of the outlook account.')
 @click.option('--password', '-p', default='PASSWORD', help='The password to connect with')
-def outlook_check(username: str, password: str) -> None:
+@click.option('--batch-size', default=100, help='Messages fetched per UID FETCH round trip.')
+@click.option('--parse-workers', default=2, help='Threads parsing emails.')
+@click.option('--render-workers', default=2, help='Threads rendering certificates.')
+@click.option('--send-workers', default=4, help='Threads sending thank you emails.')
+@click.option('--queue-size', default=100, help='Items buffered in front of each stage.')
+@click.option('--smtp-host', default='smtp.office365.com', help='The SMTP server to send through.')
+@click.option('--smtp-port', default=587, help='The SMTP port.')
+@click.option('--smtp-sessions', default=2, help='SMTP sessions kept open at once.')
+@click.option('--per-minute', default=30.0, help='Most thank you emails sent per minute.')
+@click.option('--retries', default=3, help='Attempts per email after a connection failure.')
+def outlook_check(username: str, password: str, batch_size: int, parse_workers: int,
+                  render_workers: int, send_workers: int, queue_size: int, smtp_host: str,
+                  smtp_port: int, smtp_sessions: int, per_minute: float, retries: int) -> None:
     """
     Check for new emails in the Outlook inbox.
 
     Args:
         username (str): The username of the outlook account.
         password (str): The password to connect with.
+        batch_size (int): Messages fetched per UID FETCH round trip.
+        parse_workers (int): Threads parsing emails.
+        render_workers (int): Threads rendering certificates.
+        send_workers (int): Threads sending thank you emails.
+        queue_size (int): Items buffered in front of each stage.
+        smtp_host (str): The SMTP server to send through.
+        smtp_port (int): The SMTP port.
+        smtp_sessions (int): SMTP sessions kept open at once.
+        per_minute (float): Most thank you emails sent per minute.
+        retries (int): Attempts per email after a connection failure.
     """
     # create an IMAP4 class with SSL
     imap = imaplib.IMAP4_SSL("outlook.office365.com", 993)
@@ -202,35 +494,77 @@ def outlook_check(username: str, password: str) -> None:
         status = False
 
     if status:
-        imap.select("inbox")
-
-        # filter for emails with the subject line containing 'Welcome'
-        filter_search_string = 'Donation from'
-        filter_on = f'SUBJECT "{filter_search_string}"'
-        unseen_only = False #ONLY SET TO FALSE FOR DEBUGGING, OTHERWISE YOU WILL SPAM!
-        status_string = 'UNSEEN' if unseen_only else 'All'
-
-        # perform the search
-        status, messages = imap.search(None, status_string, filter_on)
-        if len(messages[0]) == 0:
-            print('No new messages')
-        else:
-            # convert messages to a list of email IDs
-            messages = messages[0].split(b' ')
-
-            for mail in messages:
-                # extract information from the email
-                info = extract_info_from_email(imap, mail)
-
-                # create a donation certificate
-                donation_creator = DonationCertCreator(first_name=info['first_name'],
-                                                       last_name=info['last_name'],
-                                                       amount=info['amount'],
-                                                       email=info['email'])
-                pdf = donation_creator.generate_pdf()
-
-                # send a thank you email with the donation certificate attached
-                send_mail(username=username, password=password, email_address=info['email'], path_to_pdf=pdf)
+        mailbox = 'inbox'
+        imap.select(mailbox)
+        uidvalidity = int(imap.response('UIDVALIDITY')[1][0])
+
+        app = create_app()
+        with app.app_context():
+            sync = MailboxSync(get_db(), mailbox, uidvalidity)
+
+            # only look at donation emails newer than the last processed one
+            filter_search_string = 'Donation from'
+            filter_on = f'SUBJECT "{filter_search_string}"'
+
+            # perform the search
+            status, messages = imap.uid('SEARCH', None, sync.search_criteria(), filter_on)
+            # convert messages to a list of email UIDs
+            uids = sync.new_uids([int(uid) for uid in messages[0].split()])
+            if not uids:
+                print('No new messages')
+            else:
+                def new_messages():
+                    for uid, raw in fetch_messages(imap, uids, batch_size):
+                        message_id = BytesHeaderParser().parsebytes(raw)['Message-ID']
+                        if sync.already_certificated(uid, message_id):
+                            sync.mark_done(uid)
+                        else:
+                            yield uid, message_id, raw
+
+                def parse(message):
+                    uid, message_id, raw = message
+                    # extract information from the email
+                    info = parse_email(raw).extract_info()
+                    if info is None:
+                        # not a donation, nothing to send
+                        print(f'Skipping UID {uid}: no donation details found')
+                        sync.mark_done(uid)
+                        return None
+                    return uid, message_id, info
+
+                def render(parsed):
+                    uid, message_id, info = parsed
+                    # create a donation certificate
+                    donation_creator = DonationCertCreator(**info)
+                    return uid, message_id, donation_creator, donation_creator.generate_pdf()
+
+                def send(rendered):
+                    uid, message_id, donation_creator, pdf = rendered
+                    # send a thank you email with the donation certificate attached
+                    send_mail(pool=pool, sender=username, email_address=donation_creator.email,
+                              pdf=pdf, filename=donation_creator.filename)
+                    sync.record_sent(uid, message_id, donation_creator.email)
+                    return uid
+
+                pipeline = Pipeline(
+                    stages=[
+                        ('parse', parse, parse_workers),
+                        ('render', render, render_workers),
+                        ('send', send, send_workers),
+                    ],
+                    queue_size=queue_size,
+                )
+                pool = SMTPPool(smtp_host, smtp_port, username=username, password=password,
+                                size=smtp_sessions, per_minute=per_minute, retries=retries)
+                try:
+                    with pool:
+                        # the IMAP connection is not thread safe, so fetching stays on this thread
+                        stats = pipeline.run(new_messages())
+                finally:
+                    # failed messages keep the mark behind them and are retried next run
+                    last_uid = sync.commit(uids)
+                report_stats(stats)
+                print(f'Processed up to UID {last_uid} of {uids[-1]}')
 
         # close the mailbox and logout
         imap.close()
@@ -239,6 +573,3 @@ def outlook_check(username: str, password: str) -> None:
 
 if __name__ == "__main__":
     outlook_check()
-
-
-
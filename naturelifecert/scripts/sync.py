@@ -0,0 +1,128 @@
+import threading
+
+
+class MailboxSync:
+    """
+    Incremental sync state for one IMAP mailbox, kept in SQLite.
+
+    The mailbox's UIDVALIDITY and the highest UID fully processed are stored
+    in ``mailbox_sync``, so a run only needs to fetch ``UID last_uid+1:*``.
+    Every sent certificate is logged in ``certificated_email`` as it goes
+    out, which keeps re-runs (and UIDVALIDITY resets) from sending it twice.
+
+    Args:
+        db (sqlite3.Connection): The application database.
+        mailbox (str): The mailbox name, e.g. ``inbox``.
+        uidvalidity (int): The UIDVALIDITY reported when selecting the mailbox.
+    """
+
+    def __init__(self, db, mailbox: str, uidvalidity: int):
+        self.db = db
+        self.mailbox = mailbox
+        self.uidvalidity = uidvalidity
+        self._lock = threading.Lock()
+        self._done = set()
+
+        row = db.execute(
+            'SELECT uidvalidity, last_uid FROM mailbox_sync WHERE mailbox = ?', (mailbox,)
+        ).fetchone()
+        # UIDs from another UIDVALIDITY mean nothing, start over
+        self.last_uid = row['last_uid'] if row and row['uidvalidity'] == uidvalidity else 0
+
+    def search_criteria(self) -> str:
+        """
+        The UID SEARCH criteria matching only messages newer than the mark.
+
+        Returns:
+            str: e.g. ``UID 43:*``.
+        """
+        return f'UID {self.last_uid + 1}:*'
+
+    def new_uids(self, uids: list) -> list:
+        """
+        Drop UIDs at or below the mark; ``n:*`` always matches the newest message.
+
+        Args:
+            uids (list): UIDs returned by the search.
+
+        Returns:
+            list: The sorted UIDs still to process.
+        """
+        return sorted(uid for uid in uids if uid > self.last_uid)
+
+    def already_certificated(self, uid: int, message_id: str) -> bool:
+        """
+        Whether a certificate was already sent for this message.
+
+        The UID identifies the message within this UIDVALIDITY, also when it
+        has no Message-ID; the Message-ID catches it after a UIDVALIDITY reset.
+
+        Args:
+            uid (int): The message UID.
+            message_id (str): The Message-ID header, if any.
+
+        Returns:
+            bool: True if it was recorded before.
+        """
+        with self._lock:
+            return self.db.execute(
+                'SELECT 1 FROM certificated_email'
+                ' WHERE (mailbox = ? AND uidvalidity = ? AND uid = ?) OR message_id = ?',
+                (self.mailbox, self.uidvalidity, uid, message_id or None),
+            ).fetchone() is not None
+
+    def record_sent(self, uid: int, message_id: str, email_address: str) -> None:
+        """
+        Log a sent certificate and mark its message as processed.
+
+        Args:
+            uid (int): The message UID.
+            message_id (str): The Message-ID header.
+            email_address (str): Where the certificate went.
+        """
+        with self._lock:
+            self.db.execute(
+                'INSERT OR IGNORE INTO certificated_email (mailbox, uidvalidity, uid, message_id, email)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (self.mailbox, self.uidvalidity, uid, message_id, email_address),
+            )
+            self.db.commit()
+            self._done.add(uid)
+
+    def mark_done(self, uid: int) -> None:
+        """
+        Mark a message as needing no further work, e.g. it was not a donation.
+
+        Args:
+            uid (int): The message UID.
+        """
+        with self._lock:
+            self._done.add(uid)
+
+    def commit(self, uids: list) -> int:
+        """
+        Advance the mark past the processed prefix of ``uids`` and save it.
+
+        Messages after the first unfinished one are fetched again next run;
+        the ones already sent are then skipped, see ``already_certificated``.
+
+        Args:
+            uids (list): The sorted UIDs this run tried to process.
+
+        Returns:
+            int: The new high-water mark.
+        """
+        with self._lock:
+            for uid in uids:
+                if uid not in self._done:
+                    break
+                self.last_uid = uid
+
+            self.db.execute(
+                'INSERT INTO mailbox_sync (mailbox, uidvalidity, last_uid) VALUES (?, ?, ?)'
+                ' ON CONFLICT (mailbox) DO UPDATE'
+                ' SET uidvalidity = excluded.uidvalidity, last_uid = excluded.last_uid',
+                (self.mailbox, self.uidvalidity, self.last_uid),
+            )
+            self.db.commit()
+        return self.last_uid
@@ -0,0 +1,75 @@
+import click
+from flask import Blueprint, jsonify, render_template
+from flask.cli import with_appcontext
+
+from naturelifecert.auth import login_required
+from naturelifecert.db import get_db, upgrade_db
+
+bp = Blueprint("stats", __name__, url_prefix="/stats")
+
+# Every breakdown keeps currencies apart; their sums cannot be added up
+BREAKDOWNS = {
+    "by_currency": ("currency",),
+    "by_country": ("country", "currency"),
+    "by_month": ("month", "currency"),
+}
+
+
+def donation_stats(db):
+    """Donation counts and totals read from ``donation_rollup`` only.
+
+    The rollup has one row per country, currency and month, so this costs
+    the same however many donations there are.
+    """
+    stats = {}
+    for name, columns in BREAKDOWNS.items():
+        group = ", ".join(columns)
+        stats[name] = [
+            dict(row)
+            for row in db.execute(
+                f"SELECT {group}, SUM(donations) AS donations, ROUND(SUM(total), 2) AS total"
+                f" FROM donation_rollup GROUP BY {group} ORDER BY {group}"
+            )
+        ]
+    return stats
+
+
+def rebuild_rollups(db):
+    """Recompute ``donation_rollup`` from ``post`` and return its row count."""
+    with db:
+        db.execute("DELETE FROM donation_rollup")
+        db.execute(
+            "INSERT INTO donation_rollup (country, currency, month, donations, total)"
+            " SELECT country, currency, strftime('%Y-%m', created), COUNT(*), SUM(donation)"
+            " FROM post GROUP BY 1, 2, 3"
+        )
+    return db.execute("SELECT COUNT(*) FROM donation_rollup").fetchone()[0]
+
+
+@bp.route("")
+@login_required
+def index():
+    return render_template("stats/index.html", stats=donation_stats(get_db()))
+
+
+@bp.route("/json")
+@login_required
+def data():
+    return jsonify(donation_stats(get_db()))
+
+
+@click.command("rebuild-rollups")
+@with_appcontext
+def rebuild_rollups_command():
+    """Recompute the donation statistics from every post.
+
+    Creates the rollup table and its triggers first, so this also
+    backfills the statistics of a database from before they existed.
+    """
+    upgrade_db()
+    rows = rebuild_rollups(get_db())
+    click.echo(f"Rebuilt {rows} rollup rows.")
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_rollups_command)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import pathlib
+import tempfile
+
+from flask import current_app
+
+
+class CertificateStore:
+    """Rendered certificates on disk, addressed by the SHA-256 of their bytes.
+
+    A PDF lives at ``root/ab/cd/<hash>.pdf``; the two shard levels keep
+    every directory small. Files are written once and never changed, so
+    identical certificates share a file and can be served straight from
+    disk (or handed to the web server with ``X-Sendfile``).
+    """
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+
+    def path(self, digest):
+        return self.root / digest[:2] / digest[2:4] / f"{digest}.pdf"
+
+    def exists(self, digest):
+        return self.path(digest).is_file()
+
+    def get(self, digest):
+        return self.path(digest).read_bytes()
+
+    def put(self, pdf):
+        """Store ``pdf`` unless an identical file exists and return its hash."""
+        digest = hashlib.sha256(pdf).hexdigest()
+        path = self.path(digest)
+        if not path.is_file():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write aside and rename so readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(pdf)
+                # mkstemp makes the file private; a front end server serving
+                # it through X-Sendfile may run as another user
+                os.chmod(tmp, 0o644)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return digest
+
+
+def get_store():
+    return current_app.extensions["certificate_store"]
+
+
+def store_certificate(db, pdf):
+    """Save ``pdf`` in the store and the ``certificate`` table; the caller commits."""
+    digest = get_store().put(pdf)
+    db.execute(
+        "INSERT OR IGNORE INTO certificate (hash, size) VALUES (?, ?)", (digest, len(pdf))
+    )
+    return digest
+
+
+def attach_certificate(db, post_id, pdf, key):
+    """Store ``pdf`` as the certificate of ``post_id``; the caller commits.
+
+    ``key`` is the ``certificate_key`` it was rendered for, so a certificate
+    of an older template version is not served again.
+    """
+    digest = store_certificate(db, pdf)
+    db.execute(
+        "UPDATE post SET certificate_hash = ?, certificate_key = ? WHERE id = ?",
+        (digest, key, post_id),
+    )
+    return digest
+
+
+def init_app(app):
+    app.extensions["certificate_store"] = CertificateStore(app.config["CERTIFICATE_STORE"])
@@ -0,0 +1,59 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
+
+
+def compile_templates(app):
+    """Compile every template into Jinja's cache and return how many there are.
+
+    With TEMPLATE_BYTECODE_CACHE set the compiled code is also written to
+    disk, where other workers load it instead of compiling again.
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_up(app):
+    """Prime the per-process caches before the worker takes traffic.
+
+    Loads the templates, imports reportlab with the configured certificate
+    template and fills the connection pool. Call it in each worker, e.g.
+    from a ``post_fork`` server hook, or set WARM_UP to do it in
+    ``create_app``; the pool's connections are not inherited across a fork.
+    """
+    compile_templates(app)
+
+    from naturelifecert.certificate import get_template
+
+    get_template(app.config["CERTIFICATE_TEMPLATE"])
+
+    pool = app.extensions["db_pool"]
+    connections = [pool.acquire() for _ in range(pool.size)]
+    for db in connections:
+        # reads and parses the schema into the connection
+        db.execute("SELECT COUNT(*) FROM sqlite_master")
+        pool.release(db)
+
+
+@click.command("compile-templates")
+@with_appcontext
+def compile_templates_command():
+    """Precompile the templates into the TEMPLATE_BYTECODE_CACHE directory."""
+    if current_app.config["TEMPLATE_BYTECODE_CACHE"] is None:
+        raise click.UsageError("Set TEMPLATE_BYTECODE_CACHE to a directory first.")
+
+    count = compile_templates(current_app)
+    click.echo(f"Compiled {count} templates into {current_app.config['TEMPLATE_BYTECODE_CACHE']}.")
+
+
+def init_app(app):
+    directory = app.config["TEMPLATE_BYTECODE_CACHE"]
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.cli.add_command(compile_templates_command)
@@ -1,4 +1,5 @@
 import os
+import shutil
 import tempfile
 
 import pytest
@@ -12,10 +13,12 @@ with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
 @pytest.fixture(scope='module')
 def app():
     db_fd, db_path = tempfile.mkstemp()
+    store_path = tempfile.mkdtemp()
 
     app = create_app({
         'TESTING': True,
         'DATABASE': db_path,
+        'CERTIFICATE_STORE': store_path,
     })
 
     with app.app_context():
@@ -24,8 +27,10 @@ def app():
 
     yield app
 
+    app.extensions['db_pool'].close()
     os.close(db_fd)
     os.unlink(db_path)
+    shutil.rmtree(store_path)
 
 
 @pytest.fixture
@@ -34,6 +34,31 @@ def test_create_user_command(runner, app, username, password, expected_output):
         assert expected_output in result.output
         assert result.exit_code == 0 if "Created user" in expected_output else 1
 
+def test_import_users(runner, app, tmp_path):
+    csv_file = tmp_path / "users.csv"
+    csv_file.write_text(
+        "username,password\n"
+        "imported_a,secret\n"
+        "imported_b,\n"
+        "test,secret\n"
+        "imported_a,again\n"
+        "imported_c,secret\n"
+    )
+    result = runner.invoke(args=["import-users", str(csv_file)])
+    assert result.exit_code == 0
+    assert "Created 2 of 5 users" in result.output
+    assert "Password is required." in result.output
+    assert "User test is already registered." in result.output
+    assert "User imported_a is already registered." in result.output
+
+    with app.app_context():
+        from naturelifecert.hashing import get_hasher
+        pwhash = get_db().execute(
+            "SELECT password FROM user WHERE username = 'imported_c'"
+        ).fetchone()[0]
+        assert get_hasher().verify(pwhash, "secret")
+
+
 def test_login(client, auth):
     assert client.get('/auth/login').status_code == 200
     response = auth.login()
@@ -53,6 +78,58 @@ def test_logout(client, auth):
         auth.logout()
         assert 'user_id' not in session
 
+def test_login_rehashes_outdated_password(client, auth, app):
+    auth.login('other', 'other')
+
+    with app.app_context():
+        pwhash = get_db().execute(
+            "SELECT password FROM user WHERE username = 'other'"
+        ).fetchone()[0]
+    assert pwhash.startswith('scrypt:')
+
+    auth.logout()
+    assert auth.login('other', 'other').headers["Location"] == "/"
+
+
+def test_login_busy(client, app, monkeypatch):
+    from naturelifecert.hashing import HasherBusy
+
+    def busy(*args, **kwargs):
+        raise HasherBusy(retry_after=1)
+
+    monkeypatch.setattr(app.extensions['password_hasher'], 'verify', busy)
+    response = client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_user_cache(client, auth, app):
+    auth.login()
+
+    with client:
+        client.get('/')
+        assert app.extensions['user_cache'].get(g.user['id'])['username'] == 'test'
+
+        # served from the cache without hitting the user table
+        with app.app_context():
+            get_db().execute("UPDATE user SET username = 'renamed' WHERE id = 1")
+            get_db().commit()
+        client.get('/')
+        assert g.user['username'] == 'test'
+
+        auth.logout()
+        assert 1 not in app.extensions['user_cache']
+
+    with app.app_context():
+        get_db().execute("UPDATE user SET username = 'test' WHERE id = 1")
+        get_db().commit()
+
+
+def test_user_cache_disabled():
+    from naturelifecert import create_app
+    app = create_app({'TESTING': True, 'USER_CACHE_TTL': 0})
+    assert app.extensions['user_cache'] is None
+
 
 if __name__ == '__main__':
     import pytest
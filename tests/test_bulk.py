@@ -0,0 +1,97 @@
+import io
+import zipfile
+
+import pytest
+
+from naturelifecert.db import get_db
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_generate_certificates_command(runner, tmp_path, workers):
+    output = tmp_path / "certificates.zip"
+    result = runner.invoke(
+        args=["generate-certificates", "-o", str(output), "-w", workers, "--chunk-size", "1"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Rendered 1 certificates" in result.output
+    assert "certificates/s" in result.output
+
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == ["1_test_first_name_test_last_name.pdf"]
+        assert archive.read(archive.namelist()[0]).startswith(b"%PDF")
+
+
+def test_generate_certificates_to_directory(runner, tmp_path):
+    result = runner.invoke(args=["generate-certificates", "-o", str(tmp_path), "-w", "1"])
+    assert result.exit_code == 0, result.output
+    assert [path.name for path in tmp_path.iterdir()] == ["1_test_first_name_test_last_name.pdf"]
+
+
+def test_generate_certificates_view(client, auth, app, monkeypatch):
+    response = client.post("/generate_certificates")
+    assert response.headers["Location"] == "/auth/login"
+
+    # Rendered in the request's process, whatever BULK_WORKERS says
+    from naturelifecert import bulk
+    monkeypatch.setitem(app.config, "BULK_WORKERS", 4)
+    monkeypatch.setattr(bulk.concurrent.futures, "ProcessPoolExecutor", None)
+
+    auth.login()
+    response = client.post("/generate_certificates")
+    assert response.mimetype == "application/zip"
+    assert "Link" not in response.headers
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert len(archive.namelist()) == 1
+
+    # Only the author's own donations are included
+    auth.login("other", "other")
+    assert client.post("/generate_certificates").status_code == 404
+
+
+def test_generate_certificates_document(runner, tmp_path):
+    output = tmp_path / "certificates.pdf"
+    result = runner.invoke(args=["generate-certificates", "-o", str(output)])
+    assert result.exit_code == 0, result.output
+    assert "Rendered 1 certificates" in result.output
+    assert output.read_bytes().startswith(b"%PDF")
+
+
+def test_generate_document_view(client, auth):
+    response = client.post("/generate_certificates/document")
+    assert response.headers["Location"] == "/auth/login"
+
+    auth.login()
+    response = client.post("/generate_certificates/document")
+    assert response.mimetype == "application/pdf"
+    assert response.data.count(b"/Type /Page\n") == 1
+
+    # Only the author's own donations are printed
+    auth.login("other", "other")
+    assert client.post("/generate_certificates/document").status_code == 404
+
+
+def test_generate_document_view_pages(app, client, auth, monkeypatch):
+    monkeypatch.setitem(app.config, "BULK_REQUEST_LIMIT", 2)
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (first_name, last_name, country, donation, currency, author_id)"
+            " VALUES (?, 'last', 'NL', 10, 'EUR', ?)",
+            [("second", 1), ("someone", 2), ("third", 1), ("fourth", 1)],
+        )
+        db.commit()
+
+    auth.login()
+    response = client.post("/generate_certificates/document")
+    assert response.data.count(b"/Type /Page\n") == 2
+    assert response.headers["Link"] == '</generate_certificates/document?after=3>; rel="next"'
+
+    # The other author's post 3 is skipped; the last document has no next link
+    response = client.post("/generate_certificates/document?after=3")
+    assert response.data.count(b"/Type /Page\n") == 2
+    assert "Link" not in response.headers
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,40 @@
+import pytest
+from naturelifecert.cache import LRUCache
+
+
+def test_lru_eviction_by_size():
+    cache = LRUCache(max_size=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    assert cache.get("a") == b"12345"
+
+    # "b" is now least recently used and makes room for "c"
+    cache.set("c", b"123")
+    assert "b" not in cache
+    assert cache.get("a") == b"12345"
+    assert cache.size == 8
+
+    # values bigger than the whole cache are never stored
+    cache.set("d", b"x" * 11)
+    assert "d" not in cache
+    assert len(cache) == 2
+
+
+def test_lru_counters_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("naturelifecert.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(max_entries=1, ttl=5, sizeof=lambda value: 1)
+
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    now[0] += 5
+    assert cache.get("a") is None
+    assert cache.stats() == {"entries": 0, "size": 0, "hits": 1, "misses": 2}
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
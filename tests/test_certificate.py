@@ -0,0 +1,101 @@
+import io
+import os
+import re
+import zlib
+
+import pytest
+import reportlab
+from naturelifecert.certificate import (
+    CertificateTemplate, Field, Text, compile_template, get_template, render_certificate
+)
+
+VALUES = {
+    "first_name": "Ada (the) Countess",
+    "last_name": "Lovelace",
+    "country": "UK",
+    "donation": "20",
+    "currency": "GBP",
+}
+
+
+def assert_xref_consistent(pdf):
+    startxref = int(re.search(rb"startxref\n(\d+)\n%%EOF", pdf).group(1))
+    assert pdf[startxref:].startswith(b"xref\n")
+    entries = re.findall(rb"(\d{10}) 00000 n ", pdf[startxref:])
+    for number, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(b"%d 0 obj" % number)
+
+
+@pytest.mark.parametrize("name", ["default", "landscape"])
+def test_render_certificate(name):
+    pdf = render_certificate(VALUES, name)
+    assert pdf.startswith(b"%PDF")
+    assert_xref_consistent(pdf)
+
+    stream = re.search(rb"/FlateDecode \] /Length (\d+)\n>>\nstream\n", pdf)
+    content = zlib.decompress(pdf[stream.end():stream.end() + int(stream.group(1))])
+    assert b"(First Name: ) Tj" in content
+    assert b"(Ada \\(the\\) Countess) Tj" in content
+
+    assert render_certificate(VALUES, name) == pdf
+    assert render_certificate(dict(VALUES, donation="30"), name) != pdf
+
+
+def test_templates_compiled_once():
+    assert get_template("default") is get_template("default")
+    assert get_template("default") is not get_template("landscape")
+
+
+def test_render_without_skeleton():
+    # Non-WinAnsi text and embedded fonts both go through reportlab
+    pdf = render_certificate(dict(VALUES, first_name="Łukasz"))
+    assert pdf.startswith(b"%PDF")
+
+    vera = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+    template = compile_template(CertificateTemplate(
+        name="embedded",
+        version=1,
+        pagesize=(400, 300),
+        static=(Text(20, 260, "Thank you", font="Vera"),),
+        fields=(Field("first_name", 20, 240, "Name: ", font="Vera"),),
+        fonts=(("Vera", vera),),
+    ))
+    pdf = template.render(VALUES)
+    assert pdf.startswith(b"%PDF")
+    assert b"/FontFile2" in pdf
+
+
+def test_render_without_compiled_skeleton(monkeypatch, caplog):
+    # An unexpected reportlab output layout falls back to the canvas
+    from naturelifecert import certificate
+
+    def unreadable(pdf, marker):
+        raise ValueError("subsection not found")
+
+    monkeypatch.setattr(certificate, "PageSkeleton", unreadable)
+    template = compile_template(CertificateTemplate(
+        name="unreadable", version=1, pagesize=(400, 300),
+        fields=(Field("first_name", 20, 240, "Name: "),),
+    ))
+    assert template._skeleton is None
+    assert "Cannot compile a page skeleton" in caplog.text
+    assert template.render(VALUES).startswith(b"%PDF")
+
+
+def test_render_document():
+    output = io.BytesIO()
+    rows = [dict(VALUES, first_name=f"Ada {i}") for i in range(3)]
+    assert get_template("landscape").render_document(iter(rows), output) == 3
+
+    pdf = output.getvalue()
+    assert_xref_consistent(pdf)
+    assert pdf.count(b"/Type /Page\n") == 3
+    # The static layout and the fonts are written once for all pages
+    assert pdf.count(b"/Subtype /Form") == 1
+    assert pdf.count(b"/BaseFont /Times-Bold") == 1
+    assert len(pdf) < 2 * len(render_certificate(VALUES, "landscape"))
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
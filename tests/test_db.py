@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+
+import pytest
+from naturelifecert import create_app
+from naturelifecert.db import get_db
+
+
+def test_get_close_db(app):
+    with app.app_context():
+        db = get_db()
+        assert db is get_db()
+
+    # the connection goes back to the pool and is reused
+    with app.app_context():
+        assert get_db() is db
+        assert db.execute('SELECT 1').fetchone()[0] == 1
+
+
+def test_pragmas(app):
+    with app.app_context():
+        db = get_db()
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+
+def test_release_rolls_back(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("DELETE FROM post")
+        assert db.in_transaction
+
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM post').fetchone()[0] > 0
+
+
+def test_concurrent_contexts_get_own_connections(app):
+    seen = []
+    barrier = threading.Barrier(3)
+
+    def worker():
+        with app.app_context():
+            seen.append(get_db())
+            barrier.wait()
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, seen))) == 3
+
+
+def test_init_db_command(runner, monkeypatch):
+    class Recorder(object):
+        called = False
+
+    def fake_init_db():
+        Recorder.called = True
+
+    monkeypatch.setattr('naturelifecert.db.init_db', fake_init_db)
+    result = runner.invoke(args=['init-db'])
+    assert 'Initialized' in result.output
+    assert Recorder.called
+
+
+
+# The schema before certificates, rollups and the change counter
+OLD_SCHEMA = """
+CREATE TABLE user (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL
+);
+
+CREATE TABLE post (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  first_name TEXT NOT NULL,
+  last_name TEXT NOT NULL,
+  country TEXT NOT NULL,
+  donation DECIMAL(10, 2) NOT NULL,
+  currency VARCHAR(3) NOT NULL DEFAULT 'EUR',
+  FOREIGN KEY (author_id) REFERENCES user (id)
+);
+
+INSERT INTO post (first_name, last_name, country, donation, currency, author_id, created)
+VALUES ('old', 'post', 'NL', 10, 'EUR', 1, '2022-06-01 00:00:00');
+"""
+
+
+def test_upgrade_old_database(tmp_path):
+    database = tmp_path / 'old.sqlite'
+    with sqlite3.connect(database) as db:
+        db.executescript(OLD_SCHEMA)
+    app = create_app({'TESTING': True, 'DATABASE': str(database)})
+    runner = app.test_cli_runner()
+
+    # backfilling the statistics creates their table first
+    result = runner.invoke(args=['rebuild-rollups'])
+    assert 'Rebuilt 1 rollup rows.' in result.output
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute('SELECT certificate_key, email FROM post').fetchone() is not None
+        db.execute("UPDATE post SET donation = 15")
+        db.commit()
+        assert db.execute('SELECT total FROM donation_rollup').fetchone()[0] == 15
+        assert db.execute('SELECT version FROM post_changes').fetchone()[0] == 1
+
+    # running it again changes nothing
+    result = runner.invoke(args=['upgrade-db'])
+    assert 'added no columns' in result.output
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM post').fetchone()[0] == 1
+    app.extensions['db_pool'].close()
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
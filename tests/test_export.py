@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+
+import pytest
+
+from naturelifecert.db import get_db
+
+
+@pytest.fixture(scope="module", autouse=True)
+def donations(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (first_name, last_name, country, donation, currency, author_id, created)"
+            " VALUES (?, 'export', 'NL', ?, ?, 1, ?)",
+            [
+                ("a", 10.5, "EUR", "2023-02-01 00:00:00"),
+                ("b", 20.25, "USD", "2023-03-01 00:00:00"),
+                ("c", 5, "EUR", "2023-04-01 00:00:00"),
+            ],
+        )
+        db.commit()
+
+
+def test_export_requires_login(client):
+    assert client.get("/export").headers["Location"] == "/auth/login"
+
+
+def test_export_csv(client, auth, app, monkeypatch):
+    monkeypatch.setitem(app.config, "EXPORT_BATCH_SIZE", 2)
+    auth.login()
+    response = client.get("/export?currency=EUR")
+    assert response.mimetype == "text/csv"
+    assert "donations.csv" in response.headers["Content-Disposition"]
+    assert response.is_streamed
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row["first_name"] for row in rows] == ["test_first_name", "a", "c"]
+    assert rows[1]["created"] == "2023-02-01 00:00:00"
+    assert rows[1]["donation"] == "10.5"
+
+
+def test_export_ndjson_date_range(client, auth):
+    auth.login()
+    response = client.get("/export?format=ndjson&start=2023-02-01&end=2023-04-01")
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["first_name"] for row in rows] == ["a", "b"]
+    assert rows[1]["currency"] == "USD"
+
+    # Offsets are converted to UTC, in which created is stored
+    response = client.get(
+        "/export?format=ndjson&start=2023-02-01T01:00:00%2B01:00&end=2023-03-01T01:00:00%2B02:00"
+    )
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["first_name"] for row in rows] == ["a"]
+
+    assert client.get("/export?format=xml").status_code == 400
+    assert client.get("/export?start=yesterday").status_code == 400
+
+
+def test_export_totals(client, auth):
+    auth.login()
+    assert client.get("/export/totals?start=2023-01-15").json == [
+        {"currency": "EUR", "donations": 2, "total": 15.5},
+        {"currency": "USD", "donations": 1, "total": 20.25},
+    ]
+
+
+def test_export_donations_command(runner, tmp_path):
+    output = tmp_path / "donations.ndjson"
+    result = runner.invoke(args=[
+        "export-donations", "-o", str(output), "-f", "ndjson", "--currency", "USD", "--totals",
+    ])
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line)["first_name"] for line in output.read_text().splitlines()] == ["b"]
+    assert "USD: 1 donations, 20.25" in result.output
+
+    result = runner.invoke(args=["export-donations", "--end", "2023-01-02"])
+    assert result.output.splitlines() == [
+        "id,created,first_name,last_name,country,donation,currency",
+        "1,2023-01-01 00:00:00,test_first_name,test_last_name,test_country,200,EUR",
+    ]
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,130 @@
+from decimal import Decimal
+
+import pytest
+
+from naturelifecert.scripts.extraction import (
+    get_engine, normalize_amount, normalize_currency, split_name
+)
+from naturelifecert.scripts.outlook_check import EmailParser
+
+
+@pytest.mark.parametrize(("amount", "expected"), (
+    ("20", "20"),
+    ("20.00", "20.00"),
+    ("20,00", "20.00"),
+    ("1.234,56", "1234.56"),
+    ("1,234.56", "1234.56"),
+    ("1'234.50", "1234.50"),
+    ("1 234,56", "1234.56"),
+    ("1.000", "1000"),
+    ("1,000,000", "1000000"),
+))
+def test_normalize_amount(amount, expected):
+    assert normalize_amount(amount) == Decimal(expected)
+
+
+def test_normalize_currency():
+    assert normalize_currency("€") == "EUR"
+    assert normalize_currency("US$") == "USD"
+    assert normalize_currency("chf") == "CHF"
+    assert normalize_currency("Euro") is None
+
+
+def test_split_name():
+    assert split_name("Ada King Lovelace") == ("Ada King", "Lovelace")
+    assert split_name("Marie van Dijk") == ("Marie", "van Dijk")
+    assert split_name("Cher") == ("Cher", None)
+
+
+def test_rules_dispatch_by_sender_domain():
+    engine = get_engine()
+    assert engine.rules_for("PayPal <service@paypal.com>").name == "paypal"
+    assert engine.rules_for("service@intl.paypal.com").name == "paypal"
+    assert engine.rules_for("Stripe <receipts@stripe.com>").name == "stripe"
+    assert engine.rules_for("someone@example.com").name == "generic"
+
+
+def test_extract_paypal():
+    parser = EmailParser(
+        sender="PayPal <service@paypal.com>",
+        subject="Donation from Ada Lovelace",
+        text="Hello NatureLife,\nAda Lovelace sent you €20,00 EUR\n"
+             "Contributor email: Ada@Example.com\nCountry: United Kingdom\n",
+    )
+    assert parser.extract_info() == {
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "amount": Decimal("20.00"),
+        "currency": "EUR",
+        "country": "United Kingdom",
+        "email": "ada@example.com",
+    }
+
+
+def test_extract_stripe_symbol_only():
+    info = EmailParser(
+        sender="receipts@stripe.com",
+        subject="Donation from Zoë Müller",
+        text="Amount paid: $1,234.56\nCustomer name: Zoë Müller\n"
+             "Customer email: zoe@example.org\nBilling country: DE",
+    ).extract_info()
+    assert info["amount"] == Decimal("1234.56")
+    assert info["currency"] == "USD"
+    assert (info["first_name"], info["last_name"]) == ("Zoë", "Müller")
+    assert info["country"] == "DE"
+
+
+def test_extract_provider_default_currency():
+    info = EmailParser(
+        sender="no-reply@justgiving.com",
+        subject="Donation from Grace Hopper",
+        text="You have received a donation of 15.00 from Grace Hopper (grace@example.org)",
+    ).extract_info()
+    assert info["currency"] == "GBP"
+    assert info["email"] == "grace@example.org"
+    assert info["country"] == ""
+
+
+def test_extract_generic_fields():
+    info = EmailParser(
+        sender="bob@example.com",
+        subject="Donation from Bob",
+        text="First name: Bob\nLast name: Smith\nDonation: 1.234,50 CHF\nEmail: bob@example.com",
+    ).extract_info()
+    assert (info["first_name"], info["last_name"]) == ("Bob", "Smith")
+    assert (info["amount"], info["currency"]) == (Decimal("1234.50"), "CHF")
+
+
+def test_extract_skips_provider_addresses():
+    # An unlabeled address is only the donor's if nobody else sent it
+    info = EmailParser(
+        sender="Donorbox <receipts@mail.donorbox.org>",
+        subject="Donation from Ada Lovelace",
+        text=(
+            "Questions? Write to support@donorbox.org or help@paypal.com.\n"
+            "Amount: €20.00\n"
+            "Reply to the donor at ada@example.org"
+        ),
+    ).extract_info()
+    assert info["email"] == "ada@example.org"
+
+    info = EmailParser(
+        sender="Donorbox <receipts@donorbox.org>",
+        subject="Donation from Ada Lovelace",
+        text="Questions? Write to support@donorbox.org\nAmount: €20.00",
+    ).extract_info()
+    assert info is None
+
+
+def test_extract_not_a_donation():
+    parser = EmailParser(
+        sender="newsletter@example.com",
+        subject="Donation from the archive",
+        text="Read about everything we planted this year.",
+    )
+    assert parser.extract_info() is None
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+from naturelifecert.hashing import HasherBusy, PasswordHasher
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000")
+    pwhash = hasher.hash("secret")
+    assert pwhash.startswith("pbkdf2:sha256:1000$")
+    assert hasher.verify(pwhash, "secret")
+    assert not hasher.verify(pwhash, "wrong")
+    assert not hasher.needs_rehash(pwhash)
+    assert hasher.needs_rehash("pbkdf2:sha256:50000$salt$hash")
+
+
+def test_saturated_hasher_rejects():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1, max_queue=1)
+    release = threading.Event()
+    hasher._executor.submit(release.wait)
+
+    blocked = threading.Thread(target=hasher.hash, args=("first",))
+    blocked.start()
+    try:
+        with pytest.raises(HasherBusy) as excinfo:
+            hasher.hash("second")
+        assert excinfo.value.code == 429
+    finally:
+        release.set()
+        blocked.join()
+
+    assert hasher.verify(hasher.hash("third"), "third")
+
+
+def test_slow_hasher_times_out():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1, max_queue=2, timeout=0.05)
+    release = threading.Event()
+    hasher._executor.submit(release.wait)
+    try:
+        with pytest.raises(HasherBusy) as excinfo:
+            hasher.hash("queued")
+        assert excinfo.value.code == 429
+    finally:
+        release.set()
+
+    assert hasher.verify(hasher.hash("later"), "later")
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+
+import pytest
+
+from naturelifecert.db import get_db
+from naturelifecert.imports import import_donations, read_rows, validate_donation
+
+CSV = (
+    "first_name,last_name,country,donation,currency,email,created\n"
+    "Ada,Lovelace,UK,20.00,gbp,ada@example.org,2023-05-01\n"
+    "Grace,Hopper,US,abc,USD,,\n"
+    "Marie,Curie,FR,15.5,EUR,,\n"
+    "Alan,Turing,UK,10,XYZ,,\n"
+)
+
+
+def count_posts(app, last_name=None):
+    with app.app_context():
+        return get_db().execute(
+            "SELECT COUNT(*) FROM post WHERE ? IS NULL OR last_name = ?", (last_name, last_name)
+        ).fetchone()[0]
+
+
+@pytest.mark.parametrize(
+    ("row", "error"),
+    (
+        ({"first_name": "a", "last_name": "b", "country": "NL", "currency": "EUR"}, "donation is required."),
+        ({"first_name": "a", "last_name": "b", "country": "NL", "donation": "-1", "currency": "EUR"}, "out of range"),
+        ({"first_name": "a", "last_name": "b", "country": "NL", "donation": "1.005", "currency": "EUR"}, "two decimals"),
+        ({"first_name": "a", "last_name": "b", "country": "NL", "donation": "NaN", "currency": "EUR"}, "out of range"),
+        ({"first_name": "a", "last_name": "b", "country": "NL", "donation": "1", "currency": "EURO"}, "ISO 4217"),
+        ({"first_name": "a", "last_name": "b", "country": "NL", "donation": "1", "currency": "EUR", "email": "a@b"}, "Email"),
+        ("not json", "not a JSON object"),
+    ),
+)
+def test_validate_donation_errors(row, error):
+    values, message = validate_donation(row)
+    assert values is None
+    assert error in message
+
+
+def test_validate_donation_converts_offsets_to_utc():
+    row = {"first_name": "a", "last_name": "b", "country": "NL", "donation": "1", "currency": "EUR"}
+    values, error = validate_donation(dict(row, created="2023-01-01T10:00:00+02:00"))
+    assert error is None
+    assert values[-1] == "2023-01-01 08:00:00"
+
+
+def test_validate_donation():
+    values, error = validate_donation(
+        {"first_name": " Ada ", "last_name": "Lovelace", "country": "UK", "donation": 20, "currency": "gbp"}
+    )
+    assert error is None
+    assert values == ("Ada", "Lovelace", "UK", "20", "GBP", None, None)
+
+
+def test_import_donations_batches(app):
+    rows = read_rows(io.StringIO(CSV), "csv")
+    rejects = []
+    with app.app_context():
+        db = get_db()
+        executed = []
+        imported, rejected = import_donations(
+            _Spy(db, executed), rows, 1, batch_size=1, reject=lambda *args: rejects.append(args)
+        )
+
+        assert (imported, rejected) == (2, 2)
+        assert executed == [1, 1]
+        assert [(line, error[:8]) for line, error, _ in rejects] == [(3, "Donation"), (5, "Currency")]
+
+        post = db.execute(
+            "SELECT currency, email, created FROM post WHERE last_name = 'Lovelace'"
+        ).fetchone()
+        assert post["currency"] == "GBP"
+        assert post["email"] == "ada@example.org"
+        assert str(post["created"]) == "2023-05-01 00:00:00"
+
+
+class _Spy:
+    """Records the size of every executemany batch."""
+
+    def __init__(self, db, executed):
+        self._db = db
+        self._executed = executed
+
+    def executemany(self, sql, rows):
+        self._executed.append(len(rows))
+        return self._db.executemany(sql, rows)
+
+    def __enter__(self):
+        return self._db.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._db.__exit__(*exc_info)
+
+
+def test_import_donations_command(runner, app, tmp_path):
+    source = tmp_path / "donations.ndjson"
+    source.write_text(
+        json.dumps({"first_name": "a", "last_name": "ndjson", "country": "NL", "donation": "5", "currency": "EUR"})
+        + "\n{broken\n\n"
+        + json.dumps({"first_name": "b", "last_name": "ndjson", "country": "NL", "donation": "6.5", "currency": "EUR"})
+        + "\n"
+    )
+
+    result = runner.invoke(args=["import-donations", str(source), "--author", "test"])
+    assert "Imported 2 donations, rejected 1." in result.output
+    assert count_posts(app, "ndjson") == 2
+
+    with open(f"{source}.rejects.csv", newline="") as f:
+        assert list(csv.DictReader(f)) == [
+            {"line": "2", "error": "Row is not a JSON object.", "row": "{broken"}
+        ]
+
+    result = runner.invoke(args=["import-donations", str(source), "--author", "nobody"])
+    assert result.exit_code != 0
+    assert count_posts(app, "ndjson") == 2
+
+
+def test_import_requires_login(client):
+    assert client.get("/import").headers["Location"] == "/auth/login"
+
+
+def test_import_upload(client, auth, app):
+    auth.login()
+    assert client.get("/import").status_code == 200
+
+    response = client.post(
+        "/import",
+        data={"file": (io.BytesIO(b"\xef\xbb\xbf" + CSV.replace("Lovelace", "Upload").encode()), "d.csv")},
+        headers={"Accept": "application/json"},
+    )
+    assert response.json["imported"] == 2
+    assert response.json["rejected"] == 2
+    assert response.json["rejects"][0] == {"line": 3, "error": "Donation 'abc' is not a number."}
+    assert count_posts(app, "Upload") == 1
+
+    response = client.post("/import", data={"file": (io.BytesIO(CSV.encode()), "d.csv")})
+    assert b"Imported 2 donations, rejected 2." in response.data
+
+
+def test_import_upload_with_offset_date(client, auth, app):
+    auth.login()
+    row = {"first_name": "Zoned", "last_name": "Offset", "country": "NL", "donation": "5",
+           "currency": "EUR", "created": "2023-01-01T10:00:00+02:00"}
+    response = client.post(
+        "/import",
+        data={"file": (io.BytesIO(json.dumps(row).encode()), "d.ndjson")},
+        headers={"Accept": "application/json"},
+    )
+    assert response.json["imported"] == 1
+    # the index reads created back as a timestamp
+    assert client.get("/").status_code == 200
+    with app.app_context():
+        created = get_db().execute("SELECT created FROM post WHERE last_name = 'Offset'").fetchone()[0]
+    assert str(created) == "2023-01-01 08:00:00"
+
+
+def test_import_upload_errors(client, auth, app):
+    auth.login()
+    json_headers = {"Accept": "application/json"}
+
+    response = client.post(
+        "/import", data={"file": (io.BytesIO(CSV.encode()), "d.csv"), "format": "xml"},
+        headers=json_headers,
+    )
+    assert response.status_code == 400
+    assert "Format must be one of csv, ndjson." in response.json["error"]
+
+    # text is decoded in blocks, so a small file fails before its first row
+    data = CSV.replace("Lovelace", "Latin1").encode() + "Zoë,Latin1,NL,5,EUR,,\n".encode("latin-1")
+    response = client.post("/import", data={"file": (io.BytesIO(data), "d.csv")}, headers=json_headers)
+    assert response.status_code == 400
+    assert "not UTF-8" in response.json["error"]
+    assert response.json["imported"] == 0
+    assert count_posts(app, "Latin1") == 0
+
+    response = client.post("/import", data={"file": (io.BytesIO(data), "d.csv")})
+    assert response.status_code == 200
+    assert b"not UTF-8" in response.data
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
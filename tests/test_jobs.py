@@ -0,0 +1,104 @@
+import pytest
+
+from naturelifecert.db import get_db
+from naturelifecert.jobs import claim_jobs, enqueue, fail_job, run_worker
+
+
+@pytest.fixture
+def jobs_enabled(app, monkeypatch):
+    monkeypatch.setitem(app.config, "CERTIFICATE_JOBS", True)
+
+
+def test_create_queues_job(client, auth, app, jobs_enabled):
+    auth.login()
+    response = client.post("/create", data={
+        "first_name": "Ada", "last_name": "Lovelace", "country": "UK",
+        "donation": "20", "currency": "GBP", "email": "ada@example.com",
+    })
+    assert response.headers["Location"].startswith("/jobs/")
+    job_url = response.headers["Location"]
+
+    status = client.get(f"{job_url}/status")
+    assert status.json["status"] == "queued"
+    assert status.headers["Retry-After"] == "1"
+    assert client.get(f"{job_url}/download").status_code == 409
+    assert b"refreshes" in client.get(job_url).data
+
+    result = app.test_cli_runner().invoke(args=["run-worker", "--once"])
+    assert "Processed 1 jobs." in result.output
+
+    status = client.get(f"{job_url}/status")
+    assert status.json["status"] == "done"
+    download = client.get(status.json["download_url"])
+    assert download.mimetype == "application/pdf"
+    assert download.data.startswith(b"%PDF")
+    assert "naturelifecert_Ada_Lovelace.pdf" in download.headers["Content-Disposition"]
+
+
+def test_job_belongs_to_author(client, auth, app):
+    with app.app_context():
+        db = get_db()
+        job_id = enqueue(db, 1)
+        db.commit()
+
+    assert client.get(f"/jobs/{job_id}/status").headers["Location"] == "/auth/login"
+    auth.login("other", "other")
+    assert client.get(f"/jobs/{job_id}/status").status_code == 403
+    assert client.get("/jobs/9999/status").status_code == 404
+
+
+def test_claimed_jobs_are_not_claimed_twice(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE job SET status = 'done'")
+        first, second = enqueue(db, 1), enqueue(db, 1)
+        db.commit()
+
+        assert [job["id"] for job in claim_jobs(db, limit=1)] == [first]
+        assert [job["id"] for job in claim_jobs(db, limit=10)] == [second]
+        assert claim_jobs(db, limit=10) == []
+
+        # a job whose worker died is handed out again once the lease expires
+        db.execute("UPDATE job SET started = datetime('now', '-1 hour') WHERE id = ?", (first,))
+        db.commit()
+        assert [job["id"] for job in claim_jobs(db, limit=10, lease=300)] == [first]
+
+
+def test_job_killing_its_worker_fails(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE job SET status = 'done'")
+        job_id = enqueue(db, 1)
+        db.commit()
+
+        # every attempt takes its worker down with it
+        for attempt in range(2):
+            assert [job["id"] for job in claim_jobs(db, limit=10, max_attempts=2)] == [job_id]
+            db.execute("UPDATE job SET started = datetime('now', '-1 hour') WHERE id = ?", (job_id,))
+            db.commit()
+
+        assert claim_jobs(db, limit=10, max_attempts=2) == []
+        row = db.execute("SELECT status, attempts, error FROM job WHERE id = ?", (job_id,)).fetchone()
+        assert (row["status"], row["attempts"]) == ("failed", 2)
+        assert "worker stopped" in row["error"]
+
+
+def test_failed_job_is_retried(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE job SET status = 'done'")
+        job_id = enqueue(db, 1, template="missing")
+        db.commit()
+
+        assert run_worker(db, max_attempts=2, once=True) == 2
+        row = db.execute("SELECT status, attempts, error FROM job WHERE id = ?", (job_id,)).fetchone()
+        assert (row["status"], row["attempts"]) == ("failed", 2)
+        assert "missing" in row["error"]
+
+        fail_job(db, job_id, "again", max_attempts=3)
+        assert db.execute("SELECT status FROM job WHERE id = ?", (job_id,)).fetchone()[0] == "queued"
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
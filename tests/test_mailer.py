@@ -0,0 +1,127 @@
+import smtplib
+import socket
+from email.mime.text import MIMEText
+
+import pytest
+from naturelifecert.scripts.mailer import RateLimiter, SMTPPool
+
+
+def message(to):
+    msg = MIMEText("Thank you")
+    msg["From"] = "naturelife@example.com"
+    msg["To"] = to
+    msg["Subject"] = "Thank you for your donation"
+    return msg
+
+
+class FakeSMTP:
+    instances = []
+    failures = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.logged_in = False
+        self.quit_called = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        self.logged_in = True
+
+    def sendmail(self, from_addr, to_addrs, payload):
+        if FakeSMTP.failures:
+            raise FakeSMTP.failures.pop(0)
+        self.sent.append(to_addrs)
+
+    def quit(self):
+        self.quit_called = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_smtp():
+    FakeSMTP.instances = []
+    FakeSMTP.failures = []
+    return FakeSMTP
+
+
+def test_sessions_are_reused(fake_smtp):
+    with SMTPPool("smtp.example.com", username="user", password="pw",
+                  max_messages=3, smtp_factory=fake_smtp) as pool:
+        for i in range(5):
+            pool.send(message(f"donor{i}@example.com"), "naturelife@example.com", f"donor{i}@example.com")
+
+    assert [len(smtp.sent) for smtp in fake_smtp.instances] == [3, 2]
+    assert all(smtp.logged_in and smtp.quit_called for smtp in fake_smtp.instances)
+
+
+def test_reconnect_and_retry(fake_smtp):
+    pool = SMTPPool("smtp.example.com", backoff=0, retries=2, smtp_factory=fake_smtp)
+    pool.send(message("a@example.com"), "naturelife@example.com", "a@example.com")
+
+    # the idle session was dropped by the server, a fresh one is opened
+    fake_smtp.failures = [smtplib.SMTPServerDisconnected()]
+    pool.send(message("b@example.com"), "naturelife@example.com", "b@example.com")
+    assert len(fake_smtp.instances) == 2
+
+    # transient replies are retried, permanent ones are not
+    fake_smtp.failures = [smtplib.SMTPResponseException(451, b"try later")]
+    pool.send(message("c@example.com"), "naturelife@example.com", "c@example.com")
+    fake_smtp.failures = [smtplib.SMTPResponseException(550, b"no such user")]
+    with pytest.raises(smtplib.SMTPResponseException):
+        pool.send(message("d@example.com"), "naturelife@example.com", "d@example.com")
+
+    sent = [to for smtp in fake_smtp.instances for to in smtp.sent]
+    assert sent == ["a@example.com", "b@example.com", "c@example.com"]
+
+
+def test_rate_limiter(monkeypatch):
+    now = [0.0]
+    sleeps = []
+    monkeypatch.setattr("naturelifecert.scripts.mailer.time.monotonic", lambda: now[0])
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("naturelifecert.scripts.mailer.time.sleep", sleep)
+    limiter = RateLimiter(per_minute=2)
+    for _ in range(4):
+        limiter.acquire()
+    assert sum(sleeps) == pytest.approx(60)
+
+
+def test_local_smtp_server():
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+
+    class Handler:
+        received = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.received.append(envelope.rcpt_tos)
+            return "250 OK"
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    controller = controller_module.Controller(Handler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        with SMTPPool("127.0.0.1", port, starttls=False) as pool:
+            for i in range(3):
+                pool.send(message(f"donor{i}@example.com"), "naturelife@example.com", f"donor{i}@example.com")
+            assert pool.connections_opened == 1
+    finally:
+        controller.stop()
+
+    assert Handler.received == [[f"donor{i}@example.com"] for i in range(3)]
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,90 @@
+import pytest
+from flask import g
+
+from naturelifecert import create_app
+from naturelifecert.db import get_db, init_db
+from naturelifecert.metrics import Histogram
+
+
+@pytest.fixture
+def metrics_app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'metrics.sqlite'),
+        'CERTIFICATE_STORE': str(tmp_path / 'certificates'),
+        'METRICS_ENABLED': True,
+        'PROFILE_SLOW_REQUESTS': 0,
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    app.extensions['db_pool'].close()
+
+
+def test_metrics_disabled_by_default(client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_histogram_exposition():
+    histogram = Histogram('latency_seconds', 'Latency.', labels=('endpoint',), buckets=(0.1, 1))
+    histogram.observe(0.05, endpoint='a')
+    histogram.observe(0.5, endpoint='a')
+    histogram.observe(5, endpoint='a')
+    lines = histogram.expose().splitlines()
+    assert '# TYPE latency_seconds histogram' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{endpoint="a"} 3' in lines
+
+
+def test_request_metrics(metrics_app):
+    client = metrics_app.test_client()
+    assert client.get('/').status_code == 200
+    query = 'first_name=Ada&last_name=Lovelace&country=UK&donation=20&currency=GBP'
+    assert client.get(f'/generate_pdf?{query}').status_code == 200
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'naturelifecert_request_duration_seconds_count{endpoint="pdf.index",method="GET",status="200"} 1' in text
+    assert 'naturelifecert_request_sql_queries_bucket{endpoint="pdf.index",le="2"} 1' in text
+    assert 'naturelifecert_pdf_render_seconds_count{template="default"} 1' in text
+
+
+def test_sql_instrumentation(metrics_app):
+    with metrics_app.test_request_context():
+        db = get_db()
+        db.execute('SELECT 1').fetchone()
+        db.execute('SELECT 2').fetchone()
+        assert db.in_transaction is False
+        assert g.sql_queries == 2
+        assert g.sql_seconds > 0
+
+
+def test_instrumented_transaction(metrics_app):
+    with metrics_app.test_request_context():
+        db = get_db()
+        with db:
+            db.execute("INSERT INTO user (username, password) VALUES ('metrics', 'x')")
+        assert db.in_transaction is False
+        assert g.sql_queries == 2
+
+        with pytest.raises(ZeroDivisionError):
+            with db:
+                db.execute("INSERT INTO user (username, password) VALUES ('rolled back', 'x')")
+                1 / 0
+        assert db.execute("SELECT COUNT(*) FROM user").fetchone()[0] == 1
+
+
+def test_slow_requests_are_profiled(metrics_app, tmp_path):
+    metrics_app.test_client().get('/hello')
+    profiles = list((tmp_path / 'profiles').glob('*.prof'))
+    assert len(profiles) == 1
+    assert 'hello' in profiles[0].name
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,142 @@
+import pytest
+import base64
+import email
+from decimal import Decimal
+
+from naturelifecert.scripts.outlook_check import (
+    DonationCertCreator, Pipeline, extract_text_from_email_payload, fetch_messages, html_to_text,
+    parse_email, send_mail, sequence_set
+)
+
+RAW = (
+    b"From: PayPal <service@paypal.com>\r\n"
+    b"Subject: Donation from Ada Lovelace\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"\r\n"
+    b"Ada Lovelace sent you 20.00 EUR\r\n"
+)
+
+
+class FakeIMAP:
+    def __init__(self, messages):
+        self.messages = messages
+        self.fetches = []
+
+    def uid(self, command, *args):
+        assert command == "FETCH"
+        self.fetches.append(args[0])
+        data = []
+        for part in args[0].split(","):
+            first, _, last = part.partition(":")
+            for uid in range(int(first), int(last or first) + 1):
+                if uid in self.messages:
+                    data.append((b"%d (UID %d RFC822 {1}" % (uid, uid), self.messages[uid]))
+                    data.append(b")")
+        return "OK", data
+
+
+def test_sequence_set():
+    assert sequence_set([1, 2, 3, 7, 9, 10]) == "1:3,7,9:10"
+    assert sequence_set([4]) == "4"
+
+
+def test_fetch_messages_batches():
+    imap = FakeIMAP({uid: RAW for uid in (1, 2, 3, 5, 8)})
+    fetched = list(fetch_messages(imap, [8, 1, 2, 3, 5], batch_size=3))
+    assert [uid for uid, _ in fetched] == [1, 2, 3, 5, 8]
+    assert imap.fetches == ["1:3", "5,8"]
+
+
+def test_parse_email():
+    parsed = parse_email(RAW)
+    assert parsed.sender == "PayPal <service@paypal.com>"
+    assert "20.00 EUR" in parsed.text
+
+
+def test_extract_prefers_plain_text():
+    raw = (
+        b"Subject: =?utf-8?q?Donation_from_Zo=C3=AB?=\r\n"
+        b"Content-Type: multipart/mixed; boundary=outer\r\n\r\n"
+        b"--outer\r\n"
+        b"Content-Type: multipart/alternative; boundary=inner\r\n\r\n"
+        b"--inner\r\n"
+        b"Content-Type: text/plain; charset=iso-8859-1\r\n"
+        b"Content-Transfer-Encoding: quoted-printable\r\n\r\n"
+        b"Zo=EB sent you =A320.00\r\n"
+        b"--inner\r\n"
+        b"Content-Type: text/html; charset=utf-8\r\n\r\n"
+        b"<p>HTML version</p>\r\n"
+        b"--inner--\r\n"
+        b"--outer\r\n"
+        b"Content-Type: text/plain\r\n"
+        b"Content-Disposition: attachment; filename=notes.txt\r\n\r\n"
+        b"attached notes\r\n"
+        b"--outer--\r\n"
+    )
+    parsed = parse_email(raw)
+    assert parsed.subject == "Donation from Zo\u00eb"
+    assert parsed.text.strip() == "Zo\u00eb sent you \u00a320.00"
+
+
+def test_extract_html_only_and_capped():
+    msg = email.message_from_bytes(
+        b"Content-Type: text/html; charset=utf-8\r\n"
+        b"Content-Transfer-Encoding: base64\r\n\r\n"
+        + base64.encodebytes(
+            b"<html><style>p {}</style><p>Ada&nbsp;Lovelace</p><br>sent &euro;20</html>"
+            + b"x" * 1000
+        )
+    )
+    text = extract_text_from_email_payload(msg, max_bytes=80)
+    assert text == "Ada\u00a0Lovelace\nsent \u20ac20" + "x" * 7
+    assert html_to_text("<div>a</div><div>b</div>") == "a\nb"
+    assert extract_text_from_email_payload(b"<b>bold</b>") == "bold"
+    assert extract_text_from_email_payload("plain") == "plain"
+
+
+def test_pipeline():
+    sent = []
+
+    def parse(item):
+        if item == 3:
+            raise ValueError("bad email")
+        return None if item == 4 else item * 10
+
+    pipeline = Pipeline(
+        stages=[("parse", parse, 2), ("send", sent.append, 3)],
+        queue_size=2,
+    )
+    stats = pipeline.run(range(10))
+
+    assert sorted(sent) == [0, 10, 20, 50, 60, 70, 80, 90]
+    assert stats["fetch"].items == 10
+    assert (stats["parse"].items, stats["parse"].errors) == (9, 1)
+    assert stats["send"].items == 8
+    assert stats["total"].seconds > 0
+
+
+def test_donation_certificate_bytes():
+    creator = DonationCertCreator("Ada", "Lovelace", Decimal("20"), "ada@example.com", "EUR", "UK")
+    pdf = creator.generate_pdf()
+    assert pdf.startswith(b"%PDF")
+    assert creator.values()["donation"] == "20.00"
+    assert creator.filename == "naturelifecert_Ada_Lovelace.pdf"
+
+
+def test_send_mail_attaches_bytes():
+    class FakePool:
+        def send(self, msg, from_addr, to_addrs):
+            self.sent = msg, from_addr, to_addrs
+
+    pool = FakePool()
+    send_mail(pool, "naturelife@outlook.com", "ada@example.com", b"%PDF-1.4 fake", "cert.pdf")
+    msg, from_addr, to_addrs = pool.sent
+    attachment = msg.get_payload()[0]
+    assert attachment.get_filename() == "cert.pdf"
+    assert attachment.get_payload(decode=True) == b"%PDF-1.4 fake"
+    assert (from_addr, to_addrs) == ("naturelife@outlook.com", "ada@example.com")
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,170 @@
+import pathlib
+
+import pytest
+from naturelifecert.db import get_db
+
+
+def test_index(client, auth):
+    response = client.get('/')
+    assert b"Log In" in response.data
+    assert b"Register" in response.data
+    assert b"test_first_name test_last_name test_country" in response.data
+
+    auth.login()
+    response = client.get('/')
+    assert b'href="/create"' in response.data
+
+
+def test_index_pagination(client, app, monkeypatch):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (first_name, last_name, country, donation, currency, author_id, created)"
+            " VALUES (?, 'page', ?, 10, ?, 1, ?)",
+            [
+                ("second", "NL", "EUR", "2023-02-01 00:00:00"),
+                ("third", "NL", "USD", "2023-03-01 00:00:00"),
+            ],
+        )
+        db.commit()
+    monkeypatch.setitem(app.config, "POSTS_PER_PAGE", 2)
+
+    response = client.get('/')
+    assert b"third page" in response.data
+    assert b"second page" in response.data
+    assert b"test_first_name" not in response.data
+    assert b"before_id=" in response.data
+
+    response = client.get('/?before=2023-02-01 00:00:00&before_id=2')
+    assert b"test_first_name" in response.data
+    assert b"second page" not in response.data
+    assert b"Older" not in response.data
+
+    response = client.get('/?country=NL&currency=USD')
+    assert b"third page" in response.data
+    assert b"second page" not in response.data
+    assert b"Older" not in response.data
+
+
+def test_certificate_cache(app, monkeypatch):
+    from naturelifecert import pdf
+
+    calls = []
+    render = pdf.generate_pdf_from_data
+
+    def counting_render(*args):
+        calls.append(args)
+        return render(*args)
+
+    monkeypatch.setattr(pdf, "generate_pdf_from_data", counting_render)
+    args = ("Ada", "Lovelace", "UK", "20", "GBP")
+
+    with app.app_context():
+        first = pdf.get_certificate_pdf(*args)
+        assert pdf.get_certificate_pdf(*args) == first
+        assert first.startswith(b"%PDF")
+        assert len(calls) == 1
+
+        pdf.get_certificate_pdf("Ada", "Lovelace", "UK", "30", "GBP")
+        assert len(calls) == 2
+        assert app.extensions["pdf_cache"].hits >= 1
+
+
+def test_generate_pdf(client, app):
+    query = "first_name=Ada&last_name=Lovelace&country=UK&donation=20&currency=GBP"
+    response = client.get(f"/generate_pdf?{query}")
+    assert response.status_code == 200
+    assert response.mimetype == "application/pdf"
+    assert response.data.startswith(b"%PDF")
+    assert response.content_length == len(response.data)
+    assert "naturelifecert_Ada_Lovelace.pdf" in response.headers["Content-Disposition"]
+    assert not list(pathlib.Path(app.root_path).glob("*.pdf"))
+
+    etag = response.headers["ETag"]
+    response = client.get(f"/generate_pdf?{query}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_index_conditional_get(client, auth, app, monkeypatch):
+    response = client.get('/')
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert response.cache_control.public
+    assert response.cache_control.max_age == app.config['INDEX_MAX_AGE']
+    assert response.last_modified is not None
+    assert 'Cookie' in response.vary
+
+    # a matching ETag skips the page query and the template
+    from naturelifecert import pdf
+    monkeypatch.setattr(pdf, 'render_template', None)
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    monkeypatch.undo()
+
+    assert client.get('/?country=NL', headers={'If-None-Match': etag}).status_code == 200
+
+    # without an ETag the Last-Modified date is checked instead
+    monkeypatch.setattr(pdf, 'render_template', None)
+    assert client.get('/', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get(
+        '/', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}
+    ).status_code == 304
+    monkeypatch.undo()
+    assert client.get(
+        '/', headers={'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'}
+    ).status_code == 200
+
+    auth.login()
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.cache_control.private
+    assert response.cache_control.no_cache
+
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO post (first_name, last_name, country, donation, currency, author_id)"
+            " VALUES ('new', 'post', 'NL', 1, 'EUR', 1)"
+        )
+        db.commit()
+    auth.logout()
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    # an edit that keeps the totals the same still changes the page
+    etag = response.headers['ETag']
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE post SET first_name = 'renamed' WHERE first_name = 'new'")
+        db.commit()
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'renamed' in response.data
+
+    # storing a certificate does not change the page
+    etag = response.headers['ETag']
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE post SET certificate_key = 'x' WHERE first_name = 'renamed'")
+        db.commit()
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_generate_pdf_not_modified_without_rendering(client, app, monkeypatch):
+    from naturelifecert import pdf
+
+    query = "first_name=Grace&last_name=Hopper&country=US&donation=5&currency=USD"
+    response = client.get(f"/generate_pdf?{query}")
+    assert response.cache_control == {"private": None, "max-age": str(app.config["CERTIFICATE_MAX_AGE"])}
+
+    monkeypatch.setattr(pdf, "get_certificate_pdf", None)
+    response = client.get(f"/generate_pdf?{query}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.cache_control == {"private": None, "max-age": str(app.config["CERTIFICATE_MAX_AGE"])}
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
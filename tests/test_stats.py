@@ -0,0 +1,66 @@
+import pytest
+
+from naturelifecert.db import get_db
+from naturelifecert.stats import donation_stats, rebuild_rollups
+
+
+def rollup(db):
+    return [tuple(row) for row in db.execute("SELECT * FROM donation_rollup ORDER BY 1, 2, 3")]
+
+
+def test_triggers_maintain_rollup(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (first_name, last_name, country, donation, currency, author_id, created)"
+            " VALUES ('a', 'b', ?, ?, ?, 1, ?)",
+            [
+                ("NL", 10, "EUR", "2023-01-15 00:00:00"),
+                ("NL", 5.5, "EUR", "2023-01-20 00:00:00"),
+                ("DE", 7, "USD", "2023-02-01 00:00:00"),
+            ],
+        )
+        db.execute("UPDATE post SET country = 'BE' WHERE donation = 7")
+        db.execute("DELETE FROM post WHERE donation = 10")
+        db.commit()
+
+        assert rollup(db) == [
+            ("BE", "USD", "2023-02", 1, 7),
+            ("NL", "EUR", "2023-01", 1, 5.5),
+            ("test_country", "EUR", "2023-01", 1, 200),
+        ]
+
+        # the triggers agree with recomputing from scratch
+        incremental = rollup(db)
+        assert rebuild_rollups(db) == 3
+        assert rollup(db) == incremental
+
+
+def test_stats_views(client, auth, app):
+    assert client.get("/stats").headers["Location"] == "/auth/login"
+
+    auth.login()
+    data = client.get("/stats/json").json
+    with app.app_context():
+        assert data == donation_stats(get_db())
+    assert {"currency": "EUR", "donations": 2, "total": 205.5} in data["by_currency"]
+    assert {"month": "2023-01", "currency": "EUR", "donations": 2, "total": 205.5} in data["by_month"]
+
+    response = client.get("/stats")
+    assert b"By country" in response.data
+    assert b"205.50" in response.data
+
+
+def test_rebuild_rollups_command(runner, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("DELETE FROM donation_rollup")
+        db.commit()
+
+    result = runner.invoke(args=["rebuild-rollups"])
+    assert "Rebuilt 3 rollup rows." in result.output
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
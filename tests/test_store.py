@@ -0,0 +1,120 @@
+import dataclasses
+import hashlib
+import re
+import stat
+import zlib
+
+import pytest
+from naturelifecert.db import get_db
+from naturelifecert.store import CertificateStore, store_certificate
+
+
+def test_store_dedups_by_content(tmp_path):
+    store = CertificateStore(tmp_path)
+    digest = store.put(b"%PDF-1.4 one")
+    assert digest == hashlib.sha256(b"%PDF-1.4 one").hexdigest()
+    assert store.path(digest) == tmp_path / digest[:2] / digest[2:4] / f"{digest}.pdf"
+    assert store.put(b"%PDF-1.4 one") == digest
+    assert store.get(digest) == b"%PDF-1.4 one"
+    assert [path.name for path in tmp_path.rglob("*") if path.is_file()] == [f"{digest}.pdf"]
+    assert store.exists(digest)
+    assert not store.exists(hashlib.sha256(b"missing").hexdigest())
+    # readable by a front end server running as another user
+    assert stat.S_IMODE(store.path(digest).stat().st_mode) == 0o644
+
+
+def test_store_certificate_row(app):
+    with app.app_context():
+        db = get_db()
+        digest = store_certificate(db, b"%PDF-1.4 row")
+        store_certificate(db, b"%PDF-1.4 row")
+        db.commit()
+        assert db.execute(
+            "SELECT size FROM certificate WHERE hash = ?", (digest,)
+        ).fetchall()[0]["size"] == len(b"%PDF-1.4 row")
+
+
+def test_download_pdf(client, auth, app, monkeypatch):
+    assert client.get("/download_pdf/1").headers["Location"] == "/auth/login"
+
+    auth.login()
+    response = client.get("/download_pdf/1")
+    assert response.mimetype == "application/pdf"
+    assert response.data.startswith(b"%PDF")
+    digest = response.headers["ETag"].strip('"')
+
+    with app.app_context():
+        post = get_db().execute("SELECT certificate_hash FROM post WHERE id = 1").fetchone()
+        assert post["certificate_hash"] == digest
+
+    # later downloads come from the store without rendering again
+    from naturelifecert import pdf
+    monkeypatch.setattr(pdf, "get_certificate_pdf", None)
+    again = client.get("/download_pdf/1")
+    assert again.data == response.data
+    cache_control = {"private": None, "max-age": str(app.config["CERTIFICATE_MAX_AGE"])}
+    assert again.cache_control == cache_control
+    not_modified = client.get("/download_pdf/1", headers={"If-None-Match": f'"{digest}"'})
+    assert not_modified.status_code == 304
+    assert not_modified.cache_control == cache_control
+
+    monkeypatch.setitem(app.config, "USE_X_SENDFILE", True)
+    sendfile = client.get("/download_pdf/1")
+    assert sendfile.headers["X-Sendfile"].endswith(f"{digest}.pdf")
+    assert sendfile.data == b""
+
+
+def test_create_redirects_to_download(client, auth):
+    auth.login()
+    response = client.post("/create", data={
+        "first_name": "Ada", "last_name": "Lovelace", "country": "UK",
+        "donation": "20", "currency": "GBP", "email": "ada@example.com",
+    })
+    assert response.headers["Location"].startswith("/download_pdf/")
+    assert client.get(response.headers["Location"]).data.startswith(b"%PDF")
+
+    auth.logout()
+    auth.login("other", "other")
+    assert client.get(response.headers["Location"]).status_code == 403
+
+
+def test_download_pdf_rerenders_other_template_version(client, auth, app, monkeypatch):
+    from naturelifecert import certificate, pdf
+
+    auth.login()
+    client.get("/download_pdf/1")
+
+    rendered = []
+    render = pdf.get_certificate_pdf
+    monkeypatch.setattr(pdf, "get_certificate_pdf", lambda *args: rendered.append(args) or render(*args))
+    client.get("/download_pdf/1")
+    assert rendered == []
+
+    bumped = dataclasses.replace(certificate.TEMPLATES["default"], version=99)
+    monkeypatch.setitem(certificate.TEMPLATES, "default", bumped)
+    assert client.get("/download_pdf/1").data.startswith(b"%PDF")
+    assert len(rendered) == 1
+
+    with app.app_context():
+        post = get_db().execute("SELECT certificate_key FROM post WHERE id = 1").fetchone()
+    assert post["certificate_key"] == certificate.certificate_key(
+        {"first_name": "test_first_name", "last_name": "test_last_name",
+         "country": "test_country", "donation": 200, "currency": "EUR"},
+    )
+
+
+def test_download_pdf_formats_donation(client, auth):
+    auth.login()
+    response = client.post("/create", data={
+        "first_name": "Ada", "last_name": "Lovelace", "country": "UK",
+        "donation": "20.50", "currency": "GBP", "email": "ada@example.com",
+    })
+    pdf = client.get(response.headers["Location"]).data
+    stream = re.search(rb"/FlateDecode \] /Length (\d+)\n>>\nstream\n", pdf)
+    content = zlib.decompress(pdf[stream.end():stream.end() + int(stream.group(1))])
+    assert b"(20.50) Tj" in content
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
@@ -0,0 +1,57 @@
+import pytest
+from naturelifecert.db import get_db
+from naturelifecert.scripts.sync import MailboxSync
+
+
+def test_incremental_sync(app):
+    with app.app_context():
+        sync = MailboxSync(get_db(), 'inbox', 100)
+        assert sync.search_criteria() == 'UID 1:*'
+
+        uids = sync.new_uids([7, 3, 5, 9])
+        assert uids == [3, 5, 7, 9]
+        sync.record_sent(3, '<a@example.com>', 'a@example.com')
+        sync.mark_done(5)
+        # 7 failed to send, 9 went out anyway
+        sync.record_sent(9, '<c@example.com>', 'c@example.com')
+        assert sync.commit(uids) == 5
+
+        sync = MailboxSync(get_db(), 'inbox', 100)
+        assert sync.search_criteria() == 'UID 6:*'
+        # "n:*" matches the newest message even when it is older than n
+        assert sync.new_uids([5]) == []
+        assert sync.already_certificated(9, '<c@example.com>')
+        assert not sync.already_certificated(7, '<b@example.com>')
+        assert not sync.already_certificated(7, None)
+        # after a UIDVALIDITY reset only the Message-ID is left to match
+        assert MailboxSync(get_db(), 'inbox', 101).already_certificated(1, '<c@example.com>')
+
+
+def test_message_without_message_id(app):
+    with app.app_context():
+        sync = MailboxSync(get_db(), 'no-ids', 1)
+        uids = sync.new_uids([1, 2])
+        # 1 failed, 2 went out but has no Message-ID
+        sync.record_sent(2, None, 'b@example.com')
+        assert sync.commit(uids) == 0
+
+        sync = MailboxSync(get_db(), 'no-ids', 1)
+        assert sync.new_uids([1, 2]) == [1, 2]
+        assert not sync.already_certificated(1, None)
+        assert sync.already_certificated(2, None)
+        assert not MailboxSync(get_db(), 'other', 1).already_certificated(2, None)
+
+
+def test_uidvalidity_change_restarts(app):
+    with app.app_context():
+        sync = MailboxSync(get_db(), 'archive', 1)
+        sync.mark_done(10)
+        assert sync.commit([10]) == 10
+
+        assert MailboxSync(get_db(), 'archive', 1).last_uid == 10
+        assert MailboxSync(get_db(), 'archive', 2).last_uid == 0
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)
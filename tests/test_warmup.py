@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from naturelifecert import create_app
+from naturelifecert.warmup import compile_templates, warm_up
+
+
+def test_create_app_defers_reportlab():
+    code = (
+        "import sys\n"
+        "from naturelifecert import create_app\n"
+        "create_app({'TESTING': True}).test_client().get('/auth/login')\n"
+        "print('reportlab' in sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_compile_templates_command(app, runner, tmp_path, monkeypatch):
+    result = runner.invoke(args=["compile-templates"])
+    assert "TEMPLATE_BYTECODE_CACHE" in result.output
+
+    cached = create_app({"TESTING": True, "TEMPLATE_BYTECODE_CACHE": str(tmp_path)})
+    result = cached.test_cli_runner().invoke(args=["compile-templates"])
+    count = len(cached.jinja_env.list_templates())
+    assert f"Compiled {count} templates" in result.output
+    assert len(os.listdir(tmp_path)) == count
+
+    # A fresh worker loads the bytecode instead of compiling the source
+    fresh = create_app({"TESTING": True, "TEMPLATE_BYTECODE_CACHE": str(tmp_path)})
+    monkeypatch.setattr(fresh.jinja_env, "compile", None)
+    assert compile_templates(fresh) == count
+
+
+def test_warm_up(app):
+    pool = app.extensions["db_pool"]
+    pool.close()
+    warm_up(app)
+    assert pool._idle.qsize() == pool.size
+    assert "reportlab" in sys.modules
+
+
+if __name__ == '__main__':
+    import sys
+    pytest.main(sys.argv)